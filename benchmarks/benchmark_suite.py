@@ -0,0 +1,258 @@
+"""
+Time the app's processing at increasing scales, on synthetic MADIS data
+(see benchmarks.synthetic_madis).
+
+For each scale (institutions x periods), times:
+    - process: typing, dollar conversion and calculated columns, as data_loading.dataset_loader
+    - shared_data: market aggregates, sorting and the panel cube, as data_store.get_shared_data
+    - filter_data, generate_charts and generate_descriptions, for the latest date
+    - build_figures: building the charts' plotly figures, in the configured chart pool
+      (generate_charts only creates the LazyCharts)
+
+Each scale is run in a fresh process, so the peak RSS reported is for that scale
+alone. The nested instrumentation spans of each step are included in the results.
+
+Usage (from the repo root):
+    python -m benchmarks.benchmark_suite
+    python -m benchmarks.benchmark_suite --scales 100x12 1000x600 10000x600 --repeats 3 --output benchmark_suite.json
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from utils import read_yaml
+from benchmarks.parse_benchmark import peak_rss_mb
+from benchmarks.synthetic_madis import synthetic_madis_df
+
+DEFAULT_SCALES = ['100x12', '150x58', '1000x120', '1000x600', '10000x60']
+
+def parse_scale(scale):
+    # '1000x120' -> (1000, 120)
+    institutions, periods = scale.lower().split('x')
+    return int(institutions), int(periods)
+
+def time_step(
+        step_fn,
+        repeats: int = 1,
+):
+    # Time step_fn, returning its first result with the timings and instrumentation spans of its first run
+    from instrumentation import start_rerun, rerun_spans_df
+
+    seconds = []
+    for repeat in range(repeats):
+        start_rerun()
+        start_time = time.perf_counter()
+        result = step_fn()
+        seconds.append(time.perf_counter() - start_time)
+        if repeat == 0:
+            first_result = result
+            spans = rerun_spans_df().replace({np.nan: None}).to_dict('records')
+
+    return first_result, {
+        'seconds': min(seconds),
+        'median_seconds': statistics.median(seconds),
+        'spans': spans,
+    }
+
+def benchmark_scale(
+        institutions,
+        periods,
+        accounts,
+        config_dict,
+        repeats: int = 1,
+        selected_column: str = 'Business Loans',
+        top_x_value: int = 15,
+        date_column: str = 'Period',
+        category_column: str = 'Institution Name',
+):
+    # Runs in a fresh process
+    from pd_data_frame_checks import convert_columns_dict_type_allocation, column_adjustments
+    from data_loading import add_calculated_columns
+    from data_incremental import market_aggregates
+    from panel_cube import build_panel_cube
+    from utils_dataframe_calcs import freeze_dataframe, as_at_date
+    from data_filtering import filter_data
+    from chart_generator import generate_charts, build_figures
+    from descriptions import generate_descriptions
+
+    steps = {}
+    start_rss_mb = peak_rss_mb()
+    raw_df, steps['generate'] = time_step(lambda: synthetic_madis_df(
+        institutions=institutions,
+        periods=periods,
+        accounts=accounts,
+        config_dict=config_dict,
+    ))
+
+    def process():
+        df = convert_columns_dict_type_allocation(raw_df.copy(), config_dict['column_typing_dict'])
+        df = column_adjustments(df, config_dict)
+        df[date_column] = pd.to_datetime(df[date_column])
+        return add_calculated_columns(df=df, config_dict=config_dict)
+
+    def shared_data():
+        aggregates = market_aggregates(df=df, date_column=date_column, category_column=category_column)
+        shared_df = df.drop(columns=['ABN']).sort_values(by=[date_column, category_column], kind='stable', ignore_index=True)
+        shared_df = freeze_dataframe(shared_df)
+        dates_sorted = bool(shared_df[date_column].is_monotonic_increasing)
+        panel_cube = build_panel_cube(
+            df=shared_df,
+            market_totals_df=aggregates['market_totals_df'],
+            date_column=date_column,
+            category_column=category_column,
+        )
+        return shared_df, dates_sorted, aggregates, panel_cube
+
+    df, steps['process'] = time_step(process, repeats)
+    rows = len(raw_df)
+    del raw_df
+    (shared_df, dates_sorted, aggregates, panel_cube), steps['shared_data'] = time_step(shared_data, repeats)
+    account_count = len(df.columns) - 3
+    del df
+
+    # Selections - the latest date, the largest institution reporting in every period, and
+    # the top x, as the app defaults
+    selected_date = shared_df[date_column].max()
+    current_df = as_at_date(shared_df, date_column, selected_date, dates_sorted=dates_sorted).sort_values(by=selected_column, ascending=False)
+    reporting_periods = shared_df.groupby(category_column)[date_column].nunique()
+    full_history_categories = reporting_periods.index[reporting_periods == shared_df[date_column].nunique()]
+    selected_category = current_df[current_df[category_column].isin(full_history_categories)][category_column].iloc[0]
+    top_x_category_list = list(set(current_df[category_column].iloc[0:(top_x_value+1)].tolist() + [selected_category]))
+
+    steps_fns = {
+        'filter_data': lambda: filter_data(
+            df=shared_df,
+            date_column=date_column,
+            selected_date=selected_date,
+            selected_column=selected_column,
+            category_column=category_column,
+            selected_category=selected_category,
+            top_x_category_list=top_x_category_list,
+            group_by_columns=[date_column, category_column],
+            market_totals_df=aggregates['market_totals_df'],
+            panel_cube=panel_cube,
+            dates_sorted=dates_sorted,
+        ),
+        'generate_charts': lambda: generate_charts(
+            dfs_dict=dfs_dict,
+            details_dicts=details_dicts,
+            date_column=date_column,
+            selected_date=selected_date,
+            category_column=category_column,
+            selected_category=None,
+            selected_column=selected_column,
+            top_x_category_list=top_x_category_list,
+            color_discrete_map=read_yaml(file_path='color_discrete_map.yaml'),
+        ),
+        'build_figures': lambda: build_figures(
+            charts=charts_dict,
+            pool_details=config_dict.get('chart_pool', {}),
+        ),
+        'generate_descriptions': lambda: generate_descriptions(
+            dfs_dict=dfs_dict,
+            date_column=date_column,
+            selected_column=selected_column,
+            category_column=category_column,
+            selected_category=selected_category,
+            aliases_dict=read_yaml(file_path='aliases.yaml'),
+            details_dicts=details_dicts,
+        ),
+    }
+    for step_name, step_fn in steps_fns.items():
+        try:
+            step_result, steps[step_name] = time_step(step_fn, repeats)
+        except Exception as e:
+            steps[step_name] = {'error': f'{type(e).__name__}: {e}'}
+            if step_name == 'filter_data':
+                break
+            continue
+        if step_name == 'filter_data':
+            dfs_dict, details_dicts = step_result
+        elif step_name == 'generate_charts':
+            charts_dict = step_result
+
+    return {
+        'rows': rows,
+        'accounts': account_count,
+        'steps': steps,
+        'start_rss_mb': start_rss_mb,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+def run_benchmark_suite(
+        scales,
+        config_dict,
+        accounts=None,
+        repeats: int = 1,
+):
+    results = []
+    spawn_context = multiprocessing.get_context('spawn')
+    for scale in scales:
+        institutions, periods = parse_scale(scale)
+        result = {'scale': scale, 'institutions': institutions, 'periods': periods}
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn_context) as executor:
+            try:
+                result.update(
+                    executor.submit(benchmark_scale, institutions, periods, accounts, config_dict, repeats).result()
+                )
+            except BrokenProcessPool:
+                result['error'] = 'The benchmark process was terminated (out of memory?)'
+            except Exception as e:
+                result['error'] = f'{type(e).__name__}: {e}'
+        results.append(result)
+        print_result(result)
+
+    return results
+
+def print_result(result):
+    if 'error' in result:
+        print(f"{result['scale']:>10} | failed: {result['error'][:80]}")
+        return
+
+    step_strings = [
+        f"{step_name} {step['seconds']:.3f} s" if 'error' not in step else f"{step_name} failed"
+        for step_name, step in result['steps'].items()
+    ]
+    print(
+        f"{result['scale']:>10} | {result['rows']:>9} rows | " + ' | '.join(step_strings) +
+        f" | peak RSS {result['peak_rss_mb'] or float('nan'):.1f} MB"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the app processing on synthetic MADIS data at increasing scales.')
+    parser.add_argument('--scales', nargs='*', default=DEFAULT_SCALES, help='Scales as <institutions>x<periods>')
+    parser.add_argument('--accounts', type=int, default=None, help='Number of account columns (default: the expected columns)')
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--config', default='config.yaml')
+    parser.add_argument('--output', default='benchmark_suite.json', help='JSON file for the results')
+    args = parser.parse_args()
+
+    results = run_benchmark_suite(
+        scales=args.scales,
+        config_dict=read_yaml(file_path=args.config),
+        accounts=args.accounts,
+        repeats=args.repeats,
+    )
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'repeats': args.repeats,
+            'results': results,
+        }, f, indent=2, default=str)
+
+if __name__ == '__main__':
+    main()
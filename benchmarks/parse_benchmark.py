@@ -0,0 +1,127 @@
+"""
+Time each file loading engine on the bundled data/*.xlsx files.
+
+Each engine/file run is made in a fresh process, so the peak RSS reported is
+for that run alone.
+
+Usage (from the repo root):
+    python -m benchmarks.parse_benchmark
+    python -m benchmarks.parse_benchmark --repeats 3 --output parse_benchmark.json
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import read_yaml
+from data_ingest import INGEST_ENGINES, engine_available
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    if sys.platform == 'darwin':
+        return peak_rss / (1024 * 1024)
+    return peak_rss / 1024
+
+def time_engine(
+        engine,
+        file_name,
+        config_dict,
+        date_column,
+):
+    # Runs in a fresh process
+    file_loading_details = config_dict['file_loading_details']
+    start_rss_mb = peak_rss_mb()
+    start_time = time.perf_counter()
+    df = INGEST_ENGINES[engine](
+        file_name=file_name,
+        sheet_name=file_loading_details['sheet_name'],
+        skiprows=file_loading_details['skiprows'],
+        expected_columns_list=file_loading_details['expected_columns_list'],
+        col_types_dict=config_dict['column_typing_dict'],
+        date_column=date_column,
+    )
+    seconds = time.perf_counter() - start_time
+
+    return {
+        'rows': len(df),
+        'seconds': seconds,
+        'rows_per_second': len(df) / seconds,
+        'start_rss_mb': start_rss_mb,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+def run_parse_benchmark(
+        file_names,
+        engines,
+        config_dict,
+        date_column: str = 'Period',
+        repeats: int = 1,
+):
+    results = []
+    spawn_context = multiprocessing.get_context('spawn')
+    for file_name in file_names:
+        for engine in engines:
+            for repeat in range(repeats):
+                result = {'file_name': file_name, 'engine': engine, 'repeat': repeat}
+                with ProcessPoolExecutor(max_workers=1, mp_context=spawn_context) as executor:
+                    try:
+                        result.update(
+                            executor.submit(time_engine, engine, file_name, config_dict, date_column).result()
+                        )
+                    except Exception as e:
+                        result['error'] = str(e)
+                results.append(result)
+                print_result(result)
+
+    return results
+
+def print_result(result):
+    if 'error' in result:
+        print(f"{result['engine']:>10} | {result['file_name']} | failed: {result['error'][:80]}")
+    else:
+        print(
+            f"{result['engine']:>10} | {result['file_name']} | {result['rows']:>8} rows | "
+            f"{result['seconds']:>7.2f} s | {result['rows_per_second']:>10,.0f} rows/s | "
+            f"peak RSS {result['peak_rss_mb'] or float('nan'):>7.1f} MB"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the file loading engines on the bundled xlsx files.')
+    parser.add_argument('--files', nargs='*', default=sorted(glob.glob('data/*.xlsx')))
+    parser.add_argument('--engines', nargs='*', default=list(INGEST_ENGINES))
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--config', default='config.yaml')
+    parser.add_argument('--output', default=None, help='Optional JSON file for the results')
+    args = parser.parse_args()
+
+    engines = [engine for engine in args.engines if engine_available(engine)]
+    skipped_engines = [engine for engine in args.engines if engine not in engines]
+    if skipped_engines:
+        print(f"Skipping unavailable engines: {skipped_engines}")
+
+    results = run_parse_benchmark(
+        file_names=args.files,
+        engines=engines,
+        config_dict=read_yaml(file_path=args.config),
+        repeats=args.repeats,
+    )
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
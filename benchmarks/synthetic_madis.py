@@ -0,0 +1,134 @@
+"""
+Synthetic MADIS-shaped data, for benchmarking the app beyond the bundled files.
+
+The DataFrames have the columns in expected_columns_list (config.yaml) and the
+shape of the MADIS 'Table 1' sheet as read from the file: one row per institution
+per month end, latest period first, with the accounts in $ millions. Institutions
+vary in size, hold only some accounts, and some join or leave part way through.
+
+Usage (from the repo root):
+    python -m benchmarks.synthetic_madis --institutions 1000 --periods 120 --output synthetic.parquet
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from utils import read_yaml
+
+def synthetic_account_columns(
+        expected_columns_list,
+        config_dict,
+        accounts=None,
+        date_column: str = 'Period',
+        category_column: str = 'Institution Name',
+):
+    """
+    The account columns to generate - the expected account columns, cut to or
+    extended with 'Synthetic account n' columns to the number of accounts.
+    The columns used by calculated_columns are always kept.
+    """
+    expected_accounts = [col for col in expected_columns_list if col not in [date_column, 'ABN', category_column]]
+    if accounts is None:
+        return expected_accounts
+
+    required_accounts = [
+        column_calculation[1]
+        for calculations in config_dict.get('calculated_columns', {}).values()
+        for column_calculation in calculations
+    ]
+    account_columns = [col for col in expected_accounts if col in required_accounts]
+    account_columns += [col for col in expected_accounts if col not in account_columns][:max(accounts - len(account_columns), 0)]
+    account_columns += [f'Synthetic account {n}' for n in range(1, accounts - len(account_columns) + 1)]
+
+    # Keep the file's column order
+    return sorted(account_columns, key=lambda col: expected_accounts.index(col) if col in expected_accounts else len(expected_accounts))
+
+def synthetic_madis_df(
+        institutions: int = 150,
+        periods: int = 58,
+        accounts=None,
+        end_period: str = '2023-12-31',
+        seed: int = 0,
+        config_dict=None,
+        date_column: str = 'Period',
+        category_column: str = 'Institution Name',
+):
+    """
+    Generate a MADIS-shaped DataFrame.
+
+    Parameters:
+        institutions (int): Number of institutions.
+        periods (int): Number of month ends, ending at end_period.
+        accounts (int): Number of account columns - see synthetic_account_columns. None for the expected columns.
+        end_period (str): The latest period.
+        seed (int): Random seed, so the same arguments give the same data.
+        config_dict (dict): The app config. Read from config.yaml if None.
+
+    Returns:
+        pd.DataFrame: The raw data, as read from the file.
+    """
+    if config_dict is None:
+        config_dict = read_yaml(file_path='config.yaml')
+    account_columns = synthetic_account_columns(
+        expected_columns_list=config_dict['file_loading_details']['expected_columns_list'],
+        config_dict=config_dict,
+        accounts=accounts,
+        date_column=date_column,
+        category_column=category_column,
+    )
+    rng = np.random.default_rng(seed)
+    period_dates = pd.date_range(end=end_period, periods=periods, freq='ME')
+
+    # Reporting periods - a fifth of institutions join, and a tenth leave, part way through
+    first_periods = np.where(rng.random(institutions) < 0.2, rng.integers(0, periods, institutions), 0)
+    last_periods = np.where(rng.random(institutions) < 0.1, rng.integers(0, periods, institutions), periods - 1)
+    last_periods = np.maximum(first_periods, last_periods)
+    period_positions = np.arange(periods)[:, np.newaxis]
+    present = (period_positions >= first_periods) & (period_positions <= last_periods)
+
+    # Latest period first, then by institution
+    period_rows, institution_rows = np.nonzero(present[::-1])
+    period_rows = periods - 1 - period_rows
+
+    # Institution sizes ($ millions, heavy tailed) and monthly growth
+    sizes = rng.lognormal(mean=6.0, sigma=2.0, size=institutions)
+    growth = np.exp(np.cumsum(rng.normal(0.004, 0.02, size=(periods, institutions)), axis=0))
+    balances = sizes[institution_rows] * growth[period_rows, institution_rows]
+
+    raw_df = pd.DataFrame({
+        date_column: period_dates[period_rows],
+        'ABN': (rng.integers(10**10, 10**11, institutions).astype(str))[institution_rows],
+        category_column: np.array([f'Synthetic ADI {n:05d}' for n in range(1, institutions + 1)], dtype=object)[institution_rows],
+    })
+
+    # Each institution holds about two thirds of the accounts, in varying proportions
+    for account_column in account_columns:
+        weights = rng.lognormal(mean=-2.0, sigma=1.0, size=institutions) * (rng.random(institutions) < 0.65)
+        raw_df[account_column] = np.round(balances * weights[institution_rows], 1)
+
+    return raw_df
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic MADIS-shaped dataset.')
+    parser.add_argument('--institutions', type=int, default=150)
+    parser.add_argument('--periods', type=int, default=58)
+    parser.add_argument('--accounts', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', required=True, help='Parquet or csv file for the data')
+    args = parser.parse_args()
+
+    raw_df = synthetic_madis_df(
+        institutions=args.institutions,
+        periods=args.periods,
+        accounts=args.accounts,
+        seed=args.seed,
+    )
+    if args.output.endswith('.csv'):
+        raw_df.to_csv(args.output, index=False)
+    else:
+        raw_df.to_parquet(args.output, index=False)
+    print(f"{len(raw_df)} rows written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,74 @@
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly as pt
 import altair as alt
 import plotly.graph_objects as go
+import contextvars
+import multiprocessing
+import threading
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-from utils import rounded_dollars
+from utils import rounded_dollars_array, rounded_percentages_array, details_with_defaults
+from utils_dataframe_calcs import as_at_date, freeze_dataframe
+from instrumentation import instrumented
+
+def single_trace_bar(
+        df,
+        category_column,
+        reference_col,
+        title,
+        ordered_category_list,
+        color_discrete_map,
+        height = 800,
+):
+    """
+    A horizontal bar chart with one go.Bar trace, drawn as px.bar with color=category_column
+    draws it (a trace per category), but with a single copy of the trace metadata.
+
+    Parameters:
+        df (pd.DataFrame): A row per bar, with reference_col, category_column and 'chart_txt' labels.
+        category_column (str): The bar categories.
+        reference_col (str): The bar lengths.
+        title (str): The chart title.
+        ordered_category_list (list): Categories from the top - others follow in the order of df.
+        color_discrete_map (dict): Bar colours by category, and 'default_color' for the rest.
+        height (int): The chart height.
+
+    Returns:
+        plotly.graph_objects.Figure: The chart.
+    """
+    # Categories in order, then any others in data order, as px.bar category_orders
+    category_order = list(dict.fromkeys(list(ordered_category_list) + df[category_column].tolist()))
+    category_positions = df[category_column].map({category: position for position, category in enumerate(category_order)})
+    ordered_df = df.iloc[np.argsort(category_positions.to_numpy(), kind='stable')]
+
+    # A colour per bar
+    default_color = color_discrete_map['default_color']
+    colors = [color_discrete_map.get(category, default_color) for category in ordered_df[category_column]]
+
+    fig = go.Figure(
+        go.Bar(
+            x=ordered_df[reference_col],
+            y=ordered_df[category_column],
+            orientation='h',
+            text=ordered_df['chart_txt'],
+            textposition='auto',
+            marker={'color': colors},
+            hovertemplate=f'{category_column}=%{{y}}<br>{reference_col}=%{{x}}<br>chart_txt=%{{text}}<extra></extra>',
+        )
+    )
+
+    # Horizontal categories are listed from the bottom
+    fig.update_layout(
+        title=title,
+        barmode='relative',
+        height=height,
+        yaxis={'categoryorder': 'array', 'categoryarray': category_order[::-1]},
+    )
+
+    return fig
 
 def chart_selected_col_bar(
         df,
@@ -30,19 +94,15 @@ def chart_selected_col_bar(
     if 'chart_txt' not in df.columns:
         df['chart_txt'] = ''
 
-    # Plot with Plotly Express
-    fig = px.bar(
-        df,
-        x=reference_col,
-        y=category_column,
-        orientation='h',
+    # Plot as a single trace, coloured per bar
+    fig = single_trace_bar(
+        df=df,
+        category_column=category_column,
+        reference_col=reference_col,
         title=title,
-        color=category_column,
-        text=df['chart_txt'],
-        category_orders={category_column: ordered_category_list},  # Ensure custom order is applied
+        ordered_category_list=ordered_category_list,
         color_discrete_map=color_discrete_map,
-        color_discrete_sequence=[color_discrete_map['default_color']],
-        height=800
+        height=800,
     )
 
     # Format the x-axis
@@ -111,6 +171,231 @@ def growth_over_time(
 
     return fig
 
+class LazyChart:
+    """
+    A chart that is only built when it is displayed.
+
+    Holds the chart_selected_col_bar arguments only. The figure is not kept, as the
+    charts are held in the size bounded pipeline cache - figures are reused from the
+    figure cache instead (see figure_cache.cached_figure).
+    """
+    def __init__(self, **chart_kwargs):
+        self.chart_kwargs = chart_kwargs
+
+    def __getstate__(self):
+        # For process pools - see build_figures. Read-only mappings are sent as dicts
+        return {
+            'chart_kwargs': {
+                name: dict(value) if isinstance(value, Mapping) else value
+                for name, value in self.chart_kwargs.items()
+            },
+        }
+
+    def build(self):
+        return chart_selected_col_bar(**self.chart_kwargs)
+
+    def figure(self, build_figure=None):
+        """
+        The chart's figure.
+
+        Parameters:
+            build_figure (callable): Called with no arguments to get the figure, e.g.
+                from a cache - build by default.
+        """
+        return (build_figure or self.build)()
+
+def timeline_chart(
+        df,
+        date_column,
+        category_column,
+        selected_column,
+        color_discrete_map,
+        title = None,
+        height = 800,
+):
+    """
+    A horizontal bar chart for every period, as plotly frames with a slider and
+    play button, so users can scrub through the periods in the browser.
+
+    Parameters:
+        df (pd.DataFrame): The bars of each period, with selected_column, 'Rank' and
+            'Market Share' - see panel_cube.cube_timeline_positions.
+        date_column (str): The period column.
+        category_column (str): The bar categories.
+        selected_column (str): The bar lengths.
+        color_discrete_map (dict): Bar colours by category, and 'default_color' for the rest.
+        title (str): The chart title.
+        height (int): The chart height.
+
+    Returns:
+        plotly.graph_objects.Figure: The chart, showing the latest period.
+    """
+    if title is None:
+        title = f'{selected_column} over time'
+
+    # Labels, colours and hover details of all periods at once, by period then rank
+    df = df.sort_values(by=[date_column, 'Rank'], kind='stable', ignore_index=True)
+    chart_txt = rounded_dollars_array(df[selected_column]) + ' (' + rounded_percentages_array(df['Market Share']) + ')'
+    default_color = color_discrete_map.get('default_color', '#83C9FF')
+    colors = np.array([color_discrete_map.get(category, default_color) for category in df[category_column]], dtype=object)
+    categories = df[category_column].to_numpy()
+    values = df[selected_column].to_numpy()
+    custom_data = df[['Rank', 'Market Share']].to_numpy()
+
+    # A frame per period, named by its slider label
+    period_positions = df.groupby(date_column, sort=True).indices
+    frames = []
+    for period, positions in period_positions.items():
+        frames.append(go.Frame(
+            name=pd.Timestamp(period).strftime('%b %Y'),
+            data=[go.Bar(
+                x=values[positions],
+                y=categories[positions],
+                text=chart_txt[positions],
+                marker={'color': colors[positions]},
+                customdata=custom_data[positions],
+            )],
+            # Horizontal categories are listed from the bottom
+            layout={'yaxis': {'categoryorder': 'array', 'categoryarray': categories[positions][::-1]}},
+        ))
+
+    # The same x axis for all periods, with room for the labels
+    x_min = min(np.nanmin(values, initial=0), 0)
+    x_max = max(np.nanmax(values, initial=0), 0)
+    x_padding = (x_max - x_min) * 0.15
+    x_range = [x_min - (x_padding if x_min < 0 else 0), x_max + x_padding]
+
+    latest_frame = frames[-1]
+    fig = go.Figure(
+        data=[go.Bar(
+            latest_frame.data[0],
+            orientation='h',
+            textposition='auto',
+            hovertemplate=(
+                f'{category_column}=%{{y}}<br>{selected_column}=%{{x}}<br>'
+                'Rank=%{customdata[0]}<br>Market Share=%{customdata[1]:.2%}<extra></extra>'
+            ),
+        )],
+        frames=frames,
+    )
+
+    # Scrubbing jumps straight to the period, and play steps through from the current period
+    slider_steps = [
+        {
+            'method': 'animate',
+            'label': frame.name,
+            'args': [[frame.name], {'mode': 'immediate', 'frame': {'duration': 0, 'redraw': True}, 'transition': {'duration': 0}}],
+        }
+        for frame in frames
+    ]
+    fig.update_layout(
+        title=title,
+        height=height,
+        showlegend=False,
+        xaxis={'title': selected_column, 'range': x_range, 'showgrid': True, 'gridwidth': 1, 'gridcolor': 'Grey'},
+        yaxis={'title': category_column, **latest_frame.layout.yaxis.to_plotly_json()},
+        sliders=[{
+            'active': len(frames) - 1,
+            'currentvalue': {'prefix': 'Period: '},
+            'pad': {'t': 50},
+            'steps': slider_steps,
+        }],
+        updatemenus=[{
+            'type': 'buttons',
+            'showactive': False,
+            'x': 0,
+            'y': 0,
+            'xanchor': 'right',
+            'yanchor': 'top',
+            'pad': {'t': 50, 'r': 10},
+            'buttons': [
+                {
+                    'label': 'Play',
+                    'method': 'animate',
+                    'args': [None, {'frame': {'duration': 500, 'redraw': True}, 'fromcurrent': True, 'transition': {'duration': 0}}],
+                },
+                {
+                    'label': 'Pause',
+                    'method': 'animate',
+                    'args': [[None], {'mode': 'immediate', 'frame': {'duration': 0, 'redraw': False}, 'transition': {'duration': 0}}],
+                },
+            ],
+        }],
+    )
+
+    return fig
+
+class TimelineChart(LazyChart):
+    """
+    A timeline_chart that is only built when it is displayed.
+    """
+    def build(self):
+        return timeline_chart(**self.chart_kwargs)
+
+# Default chart pool, overridden by chart_pool in config.yaml - built in turn unless opted in
+DEFAULT_CHART_POOL_DETAILS = {
+    'executor': 'thread',
+    'max_workers': 1,
+}
+
+# Pools kept for the life of the process, by executor and max_workers
+_chart_pools = {}
+_chart_pools_lock = threading.Lock()
+
+def chart_pool(
+        executor,
+        max_workers,
+):
+    with _chart_pools_lock:
+        if (executor, max_workers) not in _chart_pools:
+            if executor == 'thread':
+                pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='chart')
+            elif executor == 'process':
+                # Spawned, as forking the server's threads is unsafe
+                pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+            else:
+                raise ValueError(f"Error: unknown chart pool executor '{executor}', expecting 'thread' or 'process'")
+            _chart_pools[(executor, max_workers)] = pool
+
+        return _chart_pools[(executor, max_workers)]
+
+def build_figures(
+        charts,
+        figure_fn=None,
+        pool_details=None,
+):
+    """
+    Build the figures of several charts concurrently, in a pool of threads or processes.
+
+    Each chart is built from its own read-only arguments, so the figures are the same
+    whichever order they are built in.
+
+    Parameters:
+        charts (dict): LazyCharts by name.
+        figure_fn (callable): Called with a chart to get its figure, e.g.
+            figure_cache.cached_figure - LazyChart.figure by default. For a process
+            pool it must be picklable (a module level function, or a partial of one).
+        pool_details (dict): See DEFAULT_CHART_POOL_DETAILS. max_workers of 1 builds in turn.
+
+    Returns:
+        dict: The figures by name, in the order of charts.
+    """
+    details = details_with_defaults(DEFAULT_CHART_POOL_DETAILS, pool_details)
+    figure_fn = figure_fn or LazyChart.figure
+
+    if (int(details['max_workers']) <= 1) or (len(charts) <= 1):
+        return {name: figure_fn(chart) for name, chart in charts.items()}
+
+    pool = chart_pool(executor=details['executor'], max_workers=int(details['max_workers']))
+    if details['executor'] == 'thread':
+        # Each in a copy of the caller's context, so instrumentation spans are recorded for the rerun
+        futures = {name: pool.submit(contextvars.copy_context().run, figure_fn, chart) for name, chart in charts.items()}
+    else:
+        futures = {name: pool.submit(figure_fn, chart) for name, chart in charts.items()}
+
+    return {name: future.result() for name, future in futures.items()}
+
+@instrumented
 def generate_charts(
     dfs_dict,
     details_dicts,
@@ -122,17 +407,22 @@ def generate_charts(
     top_x_category_list,
     color_discrete_map,
 ):
+    """
+    The balance chart and the movement charts for each horizon, as LazyCharts -
+    the figures are built by LazyChart.figure (or build_figures) when displayed.
+    Each chart has its own read-only DataFrame, so they can be built concurrently.
+    """
     charts_dict = {}
 
 
     # Balance chart    
     top_x_df = dfs_dict['top_x_df_dict']['df']
-    top_x_df_current = top_x_df[top_x_df[date_column] == selected_date]
-    formatted_dollars  = top_x_df_current[selected_column].apply(rounded_dollars)
-    formatted_percentages = top_x_df_current['Market Share'].apply(lambda x: f"({x * 100:.1f} %)")
-    top_x_df_current.loc[:, 'chart_txt'] = formatted_dollars + ' ' + formatted_percentages
-    charts_dict[selected_column] = chart_selected_col_bar(
-        df = top_x_df_current,
+    top_x_df_current = as_at_date(top_x_df, date_column, selected_date).copy()
+    formatted_dollars  = rounded_dollars_array(top_x_df_current[selected_column])
+    formatted_percentages = rounded_percentages_array(top_x_df_current['Market Share'])
+    top_x_df_current.loc[:, 'chart_txt'] = formatted_dollars + ' (' + formatted_percentages + ')'
+    charts_dict[selected_column] = LazyChart(
+        df = freeze_dataframe(top_x_df_current),
         category_column = category_column,
         reference_col = f'{selected_column}',
         title = f'{selected_column}',
@@ -147,14 +437,13 @@ def generate_charts(
     for months_ago in details_dicts['months_ago_list']:
         title = details_dicts[f'date_{months_ago}_col_prefix']
         if title in dfs_dict.keys():
-            # get df
+            # get df - the filtered data may be read-only, so each chart's labels are added to its own copy
             movements_df = dfs_dict[title]['df']
             
             # Dollar Movements
             dollar_movements_col = dfs_dict[title]['dollar_movements_col_name']
-            movements_df.loc[:, 'chart_txt'] = movements_df[dollar_movements_col].apply(rounded_dollars)
-            charts_dict[dollar_movements_col] = chart_selected_col_bar(
-                df = movements_df,
+            charts_dict[dollar_movements_col] = LazyChart(
+                df = freeze_dataframe(movements_df.assign(chart_txt=rounded_dollars_array(movements_df[dollar_movements_col]))),
                 category_column = category_column,
                 reference_col = dollar_movements_col,
                 ordered_category_list= details_dicts['ordered_category_list'],
@@ -166,9 +455,8 @@ def generate_charts(
 
             # Percentage Movements
             percentage_movements_col = dfs_dict[title]['percentage_movements_col_name']
-            movements_df.loc[:, 'chart_txt'] = movements_df[percentage_movements_col].apply(lambda x: f"{x * 100:.1f} %")
-            charts_dict[percentage_movements_col] = chart_selected_col_bar(
-                df = movements_df,
+            charts_dict[percentage_movements_col] = LazyChart(
+                df = freeze_dataframe(movements_df.assign(chart_txt=rounded_percentages_array(movements_df[percentage_movements_col]))),
                 category_column = category_column,
                 reference_col = percentage_movements_col,
                 ordered_category_list= details_dicts['ordered_category_list'],
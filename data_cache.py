@@ -0,0 +1,150 @@
+import hashlib
+import json
+import logging
+from pathlib import Path
+
+import pandas as pd
+
+from utils import project_absolute_path, atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Bump this if the layout of the cached DataFrame changes
+CACHE_FORMAT_VERSION = 1
+
+# config.yaml sections which change the processed DataFrame
+PROCESSING_CONFIG_SECTIONS = [
+    'file_loading_details',
+    'column_typing_dict',
+    'column_adjustments_dict',
+    'calculated_columns',
+]
+
+def file_content_hash(
+        file_name,
+        chunk_size: int = 1024 * 1024,
+):
+    """
+    Hash the content of a file.
+
+    Parameters:
+        file_name (str): Path of the file to hash.
+        chunk_size (int): Number of bytes read at a time.
+
+    Returns:
+        str: The sha256 hex digest of the file content.
+    """
+    file_hash = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+def processing_config_hash(config_dict):
+    """
+    Hash the config.yaml sections that affect how the data is processed.
+
+    Parameters:
+        config_dict (dict): The loaded config.yaml.
+
+    Returns:
+        str: The sha256 hex digest of the processing config sections.
+    """
+    processing_config = {
+        section: config_dict.get(section) for section in PROCESSING_CONFIG_SECTIONS
+    }
+    processing_config['cache_format_version'] = CACHE_FORMAT_VERSION
+    config_json = json.dumps(processing_config, sort_keys=True, default=str)
+
+    return hashlib.sha256(config_json.encode('utf8')).hexdigest()
+
+def data_cache_key(
+        config_dict,
+        file_name,
+):
+    # Combine the source file and processing config hashes
+    combined = file_content_hash(file_name) + processing_config_hash(config_dict)
+
+    return hashlib.sha256(combined.encode('utf8')).hexdigest()
+
+def data_cache_folder(config_dict):
+    cache_details = config_dict.get('data_cache', {})
+    cache_folder = Path(cache_details.get('cache_folder', 'cache'))
+    if not cache_folder.is_absolute():
+        cache_folder = project_absolute_path() / cache_folder
+
+    return cache_folder
+
+def data_cache_enabled(config_dict):
+    return bool(config_dict.get('data_cache', {}).get('enabled', False))
+
+def data_cache_path(
+        config_dict,
+        cache_key,
+):
+    return data_cache_folder(config_dict) / f"madis_{cache_key}.parquet"
+
+def read_cached_df(
+        config_dict,
+        cache_key,
+):
+    """
+    Read a processed DataFrame from the on-disk cache.
+
+    Parameters:
+        config_dict (dict): The loaded config.yaml.
+        cache_key (str): Key generated by data_cache_key.
+
+    Returns:
+        pd.DataFrame or None: The cached DataFrame, or None on a cache miss.
+    """
+    cache_path = data_cache_path(config_dict, cache_key)
+    if not cache_path.exists():
+        logger.debug(f"Data cache miss: {cache_path}")
+        return None
+
+    try:
+        df = pd.read_parquet(cache_path)
+    except Exception as e:
+        # A broken cache file should never stop the data being loaded
+        logger.info(f"Failed to read data cache {cache_path}: {e}")
+        return None
+
+    logger.debug(f"Data cache hit: {cache_path}")
+    return df
+
+def write_cached_df(
+        df,
+        config_dict,
+        cache_key,
+):
+    """
+    Write a processed DataFrame to the on-disk cache.
+
+    The file is written to a temporary file first and then renamed, so a
+    partially written cache file is never read.
+
+    Parameters:
+        df (pd.DataFrame): The processed DataFrame.
+        config_dict (dict): The loaded config.yaml.
+        cache_key (str): Key generated by data_cache_key.
+
+    Returns:
+        bool: True if the cache file was written.
+    """
+    cache_path = data_cache_path(config_dict, cache_key)
+    try:
+        atomic_write(file_name=cache_path, write_fn=df.to_parquet)
+    except Exception as e:
+        # pyarrow may not be installed, in which case run without the cache
+        logger.info(f"Failed to write data cache {cache_path}: {e}")
+        return False
+
+    # Remove cache files for older versions of the data/config
+    for old_cache_path in cache_path.parent.glob('madis_*.parquet'):
+        if old_cache_path != cache_path:
+            old_cache_path.unlink(missing_ok=True)
+
+    logger.debug(f"Data cache written: {cache_path}")
+    return True
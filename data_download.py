@@ -0,0 +1,209 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from email.utils import formatdate
+
+import requests
+
+from utils import atomic_write, details_with_defaults
+
+logger = logging.getLogger(__name__)
+
+# Default download settings, overridden by download_details in config.yaml
+DEFAULT_DOWNLOAD_DETAILS = {
+    'connect_timeout': 5,
+    'read_timeout': 30,
+    'max_retries': 2,
+    'backoff_seconds': 1,
+    'check_interval_seconds': 60 * 60,
+}
+
+# Downloads currently in progress, keyed by absolute file path
+_in_flight_downloads = {}
+_in_flight_downloads_lock = threading.Lock()
+
+def metadata_file_name(file_name):
+    return file_name + '.meta.json'
+
+def read_download_metadata(file_name):
+    """
+    Read the ETag/Last-Modified details stored alongside a downloaded file.
+
+    Returns:
+        dict: The stored metadata, or an empty dict if none exists.
+    """
+    try:
+        with open(metadata_file_name(file_name), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def write_download_metadata(
+        file_name,
+        metadata,
+):
+    atomic_write(
+        file_name=metadata_file_name(file_name),
+        write_fn=lambda f: json.dump(metadata, f, indent=2),
+        mode='w',
+    )
+
+def conditional_headers(
+        url,
+        file_name,
+        metadata,
+):
+    # Only send conditional headers for a file we have from the same url
+    headers = {}
+    if (not os.path.exists(file_name)) or (metadata.get('url') != url):
+        return headers
+
+    if metadata.get('etag'):
+        headers['If-None-Match'] = metadata['etag']
+    if metadata.get('last_modified'):
+        headers['If-Modified-Since'] = metadata['last_modified']
+    elif not headers:
+        headers['If-Modified-Since'] = formatdate(os.path.getmtime(file_name), usegmt=True)
+
+    return headers
+
+def fetch_url_to_file(
+        url,
+        file_name,
+        download_details=None,
+        session=None,
+):
+    """
+    Download a url to a file, using a conditional request if the file was
+    downloaded before. Connection errors, timeouts and 5xx responses are
+    retried a bounded number of times.
+
+    Parameters:
+        url (str): The url to download.
+        file_name (str): Where to save the file.
+        download_details (dict): Timeouts, retries and check interval - see DEFAULT_DOWNLOAD_DETAILS.
+        session (requests.Session): Optional session to use for the request.
+
+    Returns:
+        bool: True if a new file was written, False if the existing file is current.
+    """
+    details = details_with_defaults(DEFAULT_DOWNLOAD_DETAILS, download_details)
+    session = session or requests
+    metadata = read_download_metadata(file_name)
+    timeout = (details['connect_timeout'], details['read_timeout'])
+    max_retries = int(details['max_retries'])
+
+    for attempt in range(max_retries + 1):
+        try:
+            response = session.get(
+                url,
+                headers=conditional_headers(url, file_name, metadata),
+                timeout=timeout,
+                stream=True,
+            )
+            with response:
+                # Unchanged since the last download
+                if response.status_code == 304:
+                    metadata['checked_at'] = time.time()
+                    write_download_metadata(file_name, metadata)
+                    logger.debug(f"File not modified: {file_name}")
+                    return False
+
+                # Retry server errors
+                if (response.status_code >= 500) and (attempt < max_retries):
+                    logger.info(f"Download attempt {attempt + 1} failed with status {response.status_code}: {url}")
+                    time.sleep(details['backoff_seconds'] * (2 ** attempt))
+                    continue
+                response.raise_for_status()
+
+                def write_content(f):
+                    for chunk in response.iter_content(chunk_size=1024 * 1024):
+                        f.write(chunk)
+
+                atomic_write(file_name=file_name, write_fn=write_content)
+
+                write_download_metadata(file_name, {
+                    'url': url,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'checked_at': time.time(),
+                })
+                logger.debug(f"File downloaded successfully! file_name:{file_name}")
+                return True
+
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt >= max_retries:
+                raise
+            logger.info(f"Download attempt {attempt + 1} failed: {e}")
+            time.sleep(details['backoff_seconds'] * (2 ** attempt))
+
+def recently_checked(
+        url,
+        file_name,
+        check_interval_seconds,
+):
+    # Skip the network entirely if the file was confirmed current recently
+    metadata = read_download_metadata(file_name)
+    return (
+        os.path.exists(file_name)
+        and (metadata.get('url') == url)
+        and ((time.time() - metadata.get('checked_at', 0)) < check_interval_seconds)
+    )
+
+def download_file(
+        url,
+        file_name,
+        download_details=None,
+        session=None,
+):
+    """
+    Download a url to a file, sharing a single download between concurrent callers.
+
+    The first caller for a file performs the download, and any callers arriving
+    while it is in progress wait for, and share, its result (or exception).
+
+    Parameters:
+        url (str): The url to download.
+        file_name (str): Where to save the file.
+        download_details (dict): Timeouts, retries and check interval - see DEFAULT_DOWNLOAD_DETAILS.
+        session (requests.Session): Optional session to use for the request.
+
+    Returns:
+        bool: True if a new file was written, False if the existing file is current.
+    """
+    details = details_with_defaults(DEFAULT_DOWNLOAD_DETAILS, download_details)
+    if recently_checked(url, file_name, details['check_interval_seconds']):
+        logger.debug(f"File checked recently, skipping download: {file_name}")
+        return False
+
+    key = os.path.abspath(file_name)
+    with _in_flight_downloads_lock:
+        future = _in_flight_downloads.get(key)
+        is_owner = future is None
+        if is_owner:
+            future = Future()
+            _in_flight_downloads[key] = future
+
+    # Wait for the download already in progress
+    if not is_owner:
+        logger.debug(f"Waiting for in-flight download: {file_name}")
+        return future.result()
+
+    try:
+        result = fetch_url_to_file(
+            url=url,
+            file_name=file_name,
+            download_details=details,
+            session=session,
+        )
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _in_flight_downloads_lock:
+            del _in_flight_downloads[key]
@@ -1,7 +1,10 @@
 import pandas as pd
 import numpy as np
 
-from utils import period_ago, get_months_ago_list, period_ago_prefix
+from utils import period_ago, get_months_ago_list, period_ago_prefix, comparison_col_names
+from panel_cube import cube_market_positions, cube_top_x_and_other, cube_ranked_prefix_sums
+from utils_dataframe_calcs import as_at_date, up_to_date
+from instrumentation import instrumented
 
 def market_positions(
         df,
@@ -9,20 +12,29 @@ def market_positions(
         category_column,
         selected_column
 ):
+    """
+    Rank and market share of each category within each date.
+
+    Parameters:
+    - df: A pandas DataFrame with columns date_column, category_column, and selected_column.
+
+    Returns:
+    - A pandas DataFrame of date_column, category_column, selected_column, 'Rank' and 'Market Share',
+      sorted by date and descending selected_column. Rank is NaN where selected_column has no value.
+    """
+    market_position_df = df[[date_column, category_column, selected_column]].copy()
+
+    # Rank and market share within each date, in a single grouped pass
+    date_groups = market_position_df.groupby(date_column, sort=False)[selected_column]
+    market_position_df['Rank'] = date_groups.rank(method='max', ascending=False)
+    market_position_df['Market Share'] = market_position_df[selected_column] / date_groups.transform('sum')
+
+    # Order by date, then by the selected column within each date
+    date_order = pd.factorize(market_position_df[date_column])[0]
+    market_position_df = market_position_df.iloc[
+        np.lexsort((-market_position_df[selected_column].to_numpy(), date_order))
+    ].reset_index(drop=True)
 
-    df_to_rank = df[[date_column, category_column, selected_column]]
-    market_position_df = pd.DataFrame()
-    for date in df_to_rank[date_column].unique():
-        # Generate rankings df
-        rankings_df = df_to_rank[df_to_rank[date_column] == date][[date_column, category_column, selected_column]].sort_values(by=selected_column, ascending=False)
-        rankings_df['Rank'] = rankings_df[selected_column].rank(method='max', ascending=False).astype(int)
-        rankings_df['Market Share'] = rankings_df[selected_column] / rankings_df[selected_column].sum()
-
-        # Concatengate to the complete market_position_df
-        if len(market_position_df) == 0:
-            market_position_df = rankings_df.copy()
-        else:
-            market_position_df = pd.concat([market_position_df, rankings_df], ignore_index=True)
     return market_position_df
 
 def calculate_movement_cols(
@@ -106,6 +118,21 @@ def aggregate_sums(
 
     return df_dict
 
+def market_totals_to_date(
+        market_totals_df,
+        date_column,
+        selected_date,
+):
+    # Same as aggregate_sums on the data up to the selected date
+    df_dict = {}
+    df_dict['df'] = market_totals_df[market_totals_df[date_column] <= selected_date]
+    df_dict['category_col'] = 'Account'
+    df_dict['dollar_col'] = 'Value'
+    df_dict['dollar_movements_col'] = 'Movement ($)'
+    df_dict['percentage_movements_col'] = 'Movement (%)'
+
+    return df_dict
+
 def ordered_category_list_fn(
         df,
         date_column,
@@ -114,9 +141,10 @@ def ordered_category_list_fn(
         category_column,
         other_col = 'other',
         other_at_end = True,
+        dates_sorted = False,
 ):
     # Get data for current month only
-    df_current = df[df[date_column] == selected_date]
+    df_current = as_at_date(df, date_column, selected_date, dates_sorted=dates_sorted)
     
     # Create ordered list
     ordered_category_list = df_current.sort_values(by=selected_column, ascending=False).copy()[category_column].tolist()
@@ -137,34 +165,27 @@ def attach_market_info(
         category_column,
         selected_column,
         market_position_df,
+        other_col = 'other',
 ):
     # Ensure only required columns are included
-    market_position_df = market_position_df[[date_column , category_column, selected_column, 'Rank', 'Market Share']].copy()
+    market_position_df = market_position_df[[date_column , category_column, selected_column, 'Rank', 'Market Share']]
 
-    # Create return df
-    df_ranked = pd.DataFrame()
-
-    # Loop through all dates
-    for date in df[date_column].unique():
-        # Get data for the current date
-        df_at_date = df[df[date_column] == date]
-
-        # Add rankings and market share
-        df_at_date_ranked = pd.merge(
-            df_at_date,
-            market_position_df,
-            on=[date_column, category_column, selected_column], how='left'
-        )
+    # Add rankings and market share for all dates in one merge
+    df_ranked = pd.merge(
+        df,
+        market_position_df,
+        on=[date_column, category_column, selected_column], how='left'
+    )
 
-        # Calculate 'other' values
-        df_at_date_ranked.loc[df_at_date_ranked[category_column] == 'other', 'Rank'] = len(df_at_date_ranked)
-        df_at_date_ranked.loc[df_at_date_ranked[category_column] == 'other', 'Market Share'] = (1 - df_at_date_ranked['Market Share'].sum())
+    # Calculate 'other' values: ranked last, with the residual market share for the date
+    date_groups = df_ranked.groupby(date_column, sort=False)
+    other_mask = df_ranked[category_column] == other_col
+    df_ranked.loc[other_mask, 'Rank'] = date_groups[category_column].transform('size')[other_mask]
+    df_ranked.loc[other_mask, 'Market Share'] = (1 - date_groups['Market Share'].transform('sum'))[other_mask]
 
-        # Update the df_ranked df
-        if len(df_ranked) == 0:
-            df_ranked = df_at_date_ranked.copy()
-        else:
-            df_ranked = pd.concat([df_ranked, df_at_date_ranked], ignore_index=True)
+    # Group rows by date, in order of first appearance
+    date_order = pd.factorize(df_ranked[date_column])[0]
+    df_ranked = df_ranked.iloc[np.argsort(date_order, kind='stable')].reset_index(drop=True)
 
     return df_ranked
 
@@ -225,6 +246,7 @@ def create_top_x_and_other_df(
         category_column = category_column,
         other_col = 'other',
         other_at_end = True,
+        dates_sorted = True,
     )
 
     top_x_and_other_df_dict = calculate_movement_cols(
@@ -266,6 +288,85 @@ def get_date_details(
 
     return date_details
 
+@instrumented
+def date_to_date_comparisons(
+        df,
+        date_column,
+        selected_date,
+        comparison_dates_dict,
+        selected_column,
+        category_column,
+):
+    """
+    Compare the selected date with several comparison dates, from a single
+    category x date pivot of the data.
+
+    Parameters:
+        df (pd.DataFrame): Data with date_column, category_column and selected_column.
+        date_column (str): The period column.
+        selected_date (datetime): The current date.
+        comparison_dates_dict (dict): Prefix (e.g. 'MoM') to the date to compare with.
+        selected_column (str): The column to compare.
+        category_column (str): The category column.
+
+    Returns:
+        dict: Prefix to the comparison dict, as returned by date_to_date_comparison.
+    """
+    current_date = pd.Timestamp(selected_date)
+    comparison_dates = [pd.Timestamp(date) for date in comparison_dates_dict.values()]
+
+    # One pivot of the selected column, for the current and all comparison dates
+    dates_df = df[[date_column, category_column, selected_column]]
+    dates_df = dates_df[pd.to_datetime(dates_df[date_column]).isin([current_date] + comparison_dates)]
+    wide_df = dates_df.pivot_table(
+        index=category_column,
+        columns=pd.to_datetime(dates_df[date_column]),
+        values=selected_column,
+        aggfunc='first',
+    )
+    wide_df = wide_df.reindex(columns=[current_date] + comparison_dates)
+
+    # Movements for every comparison date at once
+    current_values = wide_df[current_date].to_numpy()
+    comparison_values = wide_df[comparison_dates].to_numpy()
+    dollar_movements = current_values[:, np.newaxis] - comparison_values
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percentage_movements = dollar_movements / comparison_values
+        percentage_of_market_movements = dollar_movements / np.nansum(comparison_values, axis=0)
+
+    comparisons_dict = {}
+    for position, (prefix, comparison_date) in enumerate(comparison_dates_dict.items()):
+        col_names = comparison_col_names(selected_column, prefix)
+
+        # Categories with a value at either date, as pivoting the two dates alone would give
+        pivot_df = pd.DataFrame(
+            {
+                'comparison': comparison_values[:, position],
+                'current': current_values,
+            },
+            index=wide_df.index,
+        ).dropna(how='all')
+        rows = wide_df.index.get_indexer(pivot_df.index)
+        pivot_df.columns.name = date_column
+        pivot_df.reset_index(inplace=True)
+
+        pivot_df[col_names['dollar_movements_col_name']] = dollar_movements[rows, position]
+        pivot_df[col_names['movements_direction_col_name']] = np.where(
+            pivot_df[col_names['dollar_movements_col_name']] >= 0, 'increase', 'decrease'
+        )
+        pivot_df[col_names['percentage_movements_col_name']] = percentage_movements[rows, position]
+        pivot_df[col_names['percentage_of_market_movements_col_name']] = percentage_of_market_movements[rows, position]
+
+        comparisons_dict[prefix] = {
+            'prefix': prefix,
+            'df': pivot_df,
+            **col_names,
+            'selected_date': selected_date,
+            'comparison_date': comparison_date,
+        }
+
+    return comparisons_dict
+
 def date_to_date_comparison(
         df,
         date_column,
@@ -275,57 +376,169 @@ def date_to_date_comparison(
         category_column,
         prefix = '',
 ):
-    # Created padded varsiion of the prefix value
-    if prefix == '':
-        prefix_padded = ' '
+    # Single comparison - see date_to_date_comparisons
+    return date_to_date_comparisons(
+        df=df,
+        date_column=date_column,
+        selected_date=selected_date,
+        comparison_dates_dict={prefix: comparison_date},
+        selected_column=selected_column,
+        category_column=category_column,
+    )[prefix]
+
+@instrumented
+def filter_dates(
+        df,
+        date_column,
+        selected_date,
+        dates_sorted = False,
+):
+    """
+    Data up to the selected date, and the relevant comparison dates.
+    dates_sorted: Whether df is sorted by date_column - see utils_dataframe_calcs.up_to_date.
+
+    Returns:
+        tuple: dfs_dict with 'original_df' and 'dated_df', and details_dicts with the date details.
+    """
+    dfs_dict = {}
+
+    # Add original df to dfs dictionary (shared and read-only, so not copied)
+    dfs_dict['original_df'] = df
+
+    # Filter on the selected data filters
+    dfs_dict['dated_df'] = up_to_date(df, date_column, selected_date, dates_sorted=dates_sorted)
+
+    # Get relevant dates
+    details_dicts = get_date_details(
+        date_col_df = dfs_dict['dated_df'],
+        date_column = date_column
+    )
+
+    return dfs_dict, details_dicts
+
+@instrumented
+def filter_market_positions(
+        dated_df,
+        date_column,
+        selected_date,
+        selected_column,
+        category_column,
+        panel_cube=None,
+):
+    # Market Positioning df - sliced from the precalculated panel cube if available
+    if panel_cube is not None:
+        return cube_market_positions(
+            cube = panel_cube,
+            selected_column = selected_column,
+            selected_date = selected_date,
+        )
+
+    return market_positions(
+        df = dated_df,
+        date_column = date_column,
+        category_column = category_column,
+        selected_column = selected_column
+    )
+
+@instrumented
+def filter_aggregates(
+        dated_df,
+        date_column,
+        selected_date,
+        category_column,
+        market_totals_df=None,
+):
+    # Aggregate Data - from the precalculated market totals if available
+    if market_totals_df is not None:
+        return market_totals_to_date(
+            market_totals_df = market_totals_df,
+            date_column = date_column,
+            selected_date = selected_date,
+        )
+
+    return aggregate_sums(
+        df = dated_df,
+        date_column = date_column,
+        category_column = category_column,
+    )
+
+@instrumented
+def filter_top_x(
+        dated_df,
+        market_position_df,
+        date_details,
+        date_column,
+        selected_date,
+        selected_column,
+        category_column,
+        top_x_category_list,
+        panel_cube=None,
+        ranked_prefix_dict=None,
+):
+    """
+    Top x and 'other' data, and its period on period comparisons.
+
+    The top x data is sliced from the panel cube if panel_cube and ranked_prefix_dict
+    (see panel_cube.cube_ranked_prefix_sums) are given, otherwise grouped from dated_df.
+
+    Returns:
+        tuple: dfs_dict with 'top_x_df_dict' and a comparison dict for each
+        date_details col prefix, and details_dicts with 'ordered_category_list'.
+    """
+    dfs_dict = {}
+    details_dicts = {}
+
+    # Top x data
+    if (panel_cube is not None) and (ranked_prefix_dict is not None):
+        dfs_dict['top_x_df_dict'] = cube_top_x_and_other(
+            cube = panel_cube,
+            ranked_prefix_dict = ranked_prefix_dict,
+            selected_column = selected_column,
+            top_x_category_list = top_x_category_list,
+        )
+        details_dicts['ordered_category_list'] = ordered_category_list_fn(
+            df = dfs_dict['top_x_df_dict']['df'][[date_column, category_column, selected_column]],
+            date_column = date_column,
+            selected_date = selected_date,
+            selected_column = selected_column,
+            category_column = category_column,
+            other_col = 'other',
+            other_at_end = True,
+            # Rows are by date, then category
+            dates_sorted = True,
+        )
     else:
-        prefix_padded = ' ' + prefix + ' '
+        (
+            dfs_dict['top_x_df_dict'],
+            details_dicts['ordered_category_list']
+        ) = create_top_x_and_other_df(
+            df_dated = dated_df,
+            date_column = date_column,
+            selected_date = selected_date,
+            category_column = category_column,
+            selected_column = selected_column,
+            top_x_category_list = top_x_category_list,
+            market_position_df = market_position_df,
+        )
 
-    # df for the selected dates
-    df[date_column] = pd.to_datetime(df[date_column])
-    df_two_dates = df[df[date_column].isin([selected_date, comparison_date])]
-    df_two_dates.loc[df_two_dates[date_column] == selected_date, 'date_column_str'] = 'current'
-    df_two_dates.loc[df_two_dates[date_column] == comparison_date, 'date_column_str'] = 'comparison'
-    df_two_dates = df_two_dates.drop(date_column, axis=1).copy()
-    df_two_dates.loc[:, date_column] = df_two_dates['date_column_str']
-    df_two_dates = df_two_dates.drop('date_column_str', axis=1).copy()
-    df_two_dates = df_two_dates[[date_column, category_column, selected_column]]
-
-    # Pivot the DataFrame
-    pivot_df = df_two_dates.pivot_table(index=category_column, columns=date_column, values=selected_column, aggfunc='first')
-
-    # Reset the index to make 'category' a column again
-    pivot_df.reset_index(inplace=True)
-    
-    # Dollar Movements
-    dollar_movements_col_name = f"{selected_column} -{prefix_padded}Movement ($)"
-    pivot_df[dollar_movements_col_name] = pivot_df['current'] - pivot_df['comparison']
-
-    # Dollar Direction
-    movement_direction_col_name = f"{selected_column} -{prefix_padded}Movement Direction"
-    pivot_df[movement_direction_col_name] = np.where(pivot_df[dollar_movements_col_name] >= 0, 'increase', 'decrease')
-
-    # Percentage Movements
-    percentage_movements_col_name = f"{selected_column} -{prefix_padded}Movement (%)"
-    pivot_df[percentage_movements_col_name] = (pivot_df[dollar_movements_col_name] / pivot_df['comparison']) # * 100
-
-    # Percentage of market Movements
-    percentage_of_market_movements_col_name = f"{selected_column} -{prefix_padded}Movement as Percentage of Market(%)"
-    pivot_df[percentage_of_market_movements_col_name] = (pivot_df[dollar_movements_col_name] / pivot_df['comparison'].sum()) # * 100
-
-    date_to_date_comparison_dict = {
-        'prefix': prefix,
-        'df': pivot_df,
-        'dollar_movements_col_name': dollar_movements_col_name,
-        'movements_direction_col_name': movement_direction_col_name,
-        'percentage_movements_col_name': percentage_movements_col_name,
-        'percentage_of_market_movements_col_name': percentage_of_market_movements_col_name,
-        'selected_date': selected_date,
-        'comparison_date': comparison_date,
-    }
-
-    return date_to_date_comparison_dict
+    # Create period on period dfs, from one pivot of the top x data
+    dfs_dict.update(
+        date_to_date_comparisons(
+            df=dfs_dict['top_x_df_dict']['df'],
+            date_column=date_column,
+            selected_date=date_details['mom_dates_list'][0],
+            comparison_dates_dict={
+                date_details[f'date_{months_ago}_col_prefix']: date_details['mom_dates_list'][months_ago]
+                for months_ago in date_details['months_ago_list']
+            },
+            selected_column=selected_column,
+            category_column=category_column,
+        )
+    )
+
+    return dfs_dict, details_dicts
 
+@instrumented
 def filter_data(
         df,
         date_column,
@@ -335,73 +548,55 @@ def filter_data(
         selected_category,
         top_x_category_list,
         group_by_columns,
+        market_totals_df=None,
+        panel_cube=None,
+        dates_sorted=False,
 ):
-    # Generate return dictionaries
-    dfs_dict = {}
-    details_dicts = {}
-
-    # Add original df to dfs dictionary
-    dfs_dict['original_df'] = df.copy()
-
-    # Filter on the selected data filters
-    dfs_dict['dated_df'] = df.query(
-        f"`{date_column}` <= '{selected_date}'"
+    # Dates
+    dfs_dict, details_dicts = filter_dates(
+        df = df,
+        date_column = date_column,
+        selected_date = selected_date,
+        dates_sorted = dates_sorted,
     )
 
     # Market Positioning df
-    dfs_dict['market_position_df'] = market_positions(
-        df = dfs_dict['dated_df'],
+    dfs_dict['market_position_df'] = filter_market_positions(
+        dated_df = dfs_dict['dated_df'],
         date_column = date_column,
+        selected_date = selected_date,
+        selected_column = selected_column,
         category_column = category_column,
-        selected_column = selected_column
-    )
-
-    # Get relevant dates
-    details_dicts.update(
-        get_date_details(
-            date_col_df = dfs_dict['dated_df'],
-            date_column = date_column
-        )
+        panel_cube = panel_cube,
     )
 
     # Aggregate Data
-    dfs_dict['aggregates_df_dict'] = aggregate_sums(
-        df = dfs_dict['dated_df'],
+    dfs_dict['aggregates_df_dict'] = filter_aggregates(
+        dated_df = dfs_dict['dated_df'],
         date_column = date_column,
+        selected_date = selected_date,
         category_column = category_column,
+        market_totals_df = market_totals_df,
     )
 
     # Top x data
-    (
-        dfs_dict['top_x_df_dict'],
-        details_dicts['ordered_category_list']
-    ) = create_top_x_and_other_df(
-        df_dated = dfs_dict['dated_df'],
+    top_x_dfs_dict, top_x_details_dicts = filter_top_x(
+        dated_df = dfs_dict['dated_df'],
+        market_position_df = dfs_dict['market_position_df'],
+        date_details = details_dicts,
         date_column = date_column,
         selected_date = selected_date,
-        category_column = category_column,
         selected_column = selected_column,
+        category_column = category_column,
         top_x_category_list = top_x_category_list,
-        market_position_df = dfs_dict['market_position_df'],
+        panel_cube = panel_cube,
+        ranked_prefix_dict = None if panel_cube is None else cube_ranked_prefix_sums(
+            cube = panel_cube,
+            selected_column = selected_column,
+            selected_date = selected_date,
+        ),
     )
-
-    # Create period on period dfs
-    top_x_df = dfs_dict['top_x_df_dict']['df']
-    for months_ago in details_dicts['months_ago_list']:
-
-        # Get reference date
-        current_date = details_dicts['mom_dates_list'][0]
-        reference_date = details_dicts['mom_dates_list'][months_ago]
-
-        # Generate Chart
-        dfs_dict[details_dicts[f'date_{months_ago}_col_prefix']] = date_to_date_comparison(
-            df=top_x_df,
-            date_column=date_column,
-            selected_date=current_date,
-            comparison_date=reference_date,
-            selected_column=selected_column,
-            category_column=category_column,
-            prefix = details_dicts[f'date_{months_ago}_col_prefix'],
-        )
+    dfs_dict.update(top_x_dfs_dict)
+    details_dicts.update(top_x_details_dicts)
 
     return dfs_dict, details_dicts
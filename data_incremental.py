@@ -0,0 +1,309 @@
+import json
+import logging
+
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+from data_cache import data_cache_folder, file_content_hash, processing_config_hash
+from data_filtering import aggregate_sums
+from panel_cube import build_panel_cube, panel_cube_arrays, panel_cube_from_arrays
+from utils import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Persisted dataset files, written to <cache_folder>/dataset
+PERSISTED_FILES = {
+    'df': 'dataset.parquet',
+    'market_totals_df': 'market_totals.parquet',
+}
+PANEL_CUBE_FILE = 'panel_cube.npz'
+MANIFEST_FILE = 'manifest.json'
+
+def persisted_dataset_folder(config_dict):
+    return data_cache_folder(config_dict) / 'dataset'
+
+def account_columns(
+        df,
+        date_column,
+        category_column,
+):
+    # All numeric columns are accounts
+    return [
+        col for col in df.select_dtypes(include='number').columns
+        if col not in [date_column, category_column]
+    ]
+
+def read_persisted_dataset(config_dict):
+    """
+    Read the persisted dataset, its derived aggregates and its panel cube.
+
+    Returns:
+        dict or None: The manifest and DataFrames, or None if there is no usable persisted dataset.
+    """
+    folder = persisted_dataset_folder(config_dict)
+    try:
+        with open(folder / MANIFEST_FILE, 'r') as f:
+            persisted = {'manifest': json.load(f)}
+        for key, file_name in PERSISTED_FILES.items():
+            persisted[key] = pd.read_parquet(folder / file_name)
+        with np.load(folder / PANEL_CUBE_FILE, allow_pickle=False) as arrays:
+            persisted['panel_cube'] = panel_cube_from_arrays(dict(arrays))
+    except Exception as e:
+        logger.debug(f"No persisted dataset available: {e}")
+        return None
+
+    return persisted
+
+def write_persisted_dataset(
+        config_dict,
+        persisted,
+):
+    """
+    Write the dataset, its derived aggregates, its panel cube and then the manifest.
+
+    Each file is written to a temporary file and renamed into place.
+    """
+    folder = persisted_dataset_folder(config_dict)
+
+    try:
+        for key, file_name in PERSISTED_FILES.items():
+            atomic_write(file_name=folder / file_name, write_fn=persisted[key].to_parquet)
+        atomic_write(
+            file_name=folder / PANEL_CUBE_FILE,
+            write_fn=lambda f: np.savez(f, **panel_cube_arrays(persisted['panel_cube'])),
+        )
+        atomic_write(
+            file_name=folder / MANIFEST_FILE,
+            write_fn=lambda f: json.dump(persisted['manifest'], f, indent=2),
+            mode='w',
+        )
+    except Exception as e:
+        # pyarrow may not be installed, in which case run without persisting
+        logger.info(f"Failed to write persisted dataset: {e}")
+        return False
+
+    return True
+
+def market_totals(
+        df,
+        date_column,
+        category_column,
+):
+    """
+    Market totals and MoM movements for every account - the aggregate_sums output
+    for the full history.
+    """
+    accounts = account_columns(df, date_column, category_column)
+    market_totals_df = aggregate_sums(
+        df=df[[date_column, category_column] + accounts].copy(),
+        date_column=date_column,
+        category_column=category_column,
+    )['df']
+
+    return market_totals_df.reset_index(drop=True)
+
+def market_aggregates(
+        df,
+        date_column,
+        category_column,
+):
+    # Ranks, shares and movements of each category are calculated from the dataset
+    # itself when building the panel cube - see panel_cube.build_panel_cube
+    return {
+        'market_totals_df': market_totals(df, date_column, category_column),
+    }
+
+def changed_periods(
+        old_df,
+        new_df,
+        date_column,
+        key_columns,
+):
+    """
+    Get the periods whose rows differ between two DataFrames - new periods,
+    removed periods and periods with added, removed or revised rows.
+    """
+    old_groups = dict(tuple(old_df.groupby(date_column)))
+    new_groups = dict(tuple(new_df.groupby(date_column)))
+
+    periods = []
+    for period in sorted(set(old_groups) | set(new_groups)):
+        if (period not in old_groups) or (period not in new_groups):
+            periods.append(period)
+            continue
+
+        old_period_df = old_groups[period].sort_values(by=key_columns).reset_index(drop=True)
+        new_period_df = new_groups[period][old_period_df.columns].sort_values(by=key_columns).reset_index(drop=True)
+        if not old_period_df.equals(new_period_df):
+            periods.append(period)
+
+    return periods
+
+def merge_period_update(
+        persisted_df,
+        window_df,
+        date_column,
+        key_columns,
+        window_start,
+):
+    """
+    Apply newly read rows to the persisted dataset.
+
+    Parameters:
+        persisted_df (pd.DataFrame): The persisted dataset.
+        window_df (pd.DataFrame): The newly read rows, from window_start onwards.
+        date_column (str): The period column.
+        key_columns (list): Columns identifying a row within a period.
+        window_start (datetime): The first period read from the new file.
+
+    Returns:
+        tuple: The updated dataset, and the list of new or revised periods.
+    """
+    persisted_window_df = persisted_df[persisted_df[date_column] >= window_start]
+    affected_periods = changed_periods(
+        old_df=persisted_window_df,
+        new_df=window_df,
+        date_column=date_column,
+        key_columns=key_columns,
+    )
+
+    # Keep the unchanged periods, and take the new rows for the changed periods
+    df = pd.concat([
+        persisted_df[~persisted_df[date_column].isin(affected_periods)],
+        window_df[window_df[date_column].isin(affected_periods)][persisted_df.columns],
+    ], ignore_index=True)
+    df = df.sort_values(by=date_column, kind='stable').reset_index(drop=True)
+
+    return df, affected_periods
+
+def update_market_aggregates(
+        aggregates,
+        df,
+        affected_periods,
+        date_column,
+        category_column,
+):
+    """
+    Recalculate the derived aggregates and the panel cube for the affected periods only.
+
+    Movements also change in the month after an affected period, so those are
+    recalculated too, using the month before each recalculated period.
+    """
+    periods = set(df[date_column].unique())
+    month = pd.offsets.MonthEnd(1)
+    recalculate_periods = set(affected_periods) | {
+        period + month for period in affected_periods if (period + month) in periods
+    }
+    required_periods = recalculate_periods | {period - month for period in recalculate_periods}
+
+    recalculated = market_aggregates(
+        df=df[df[date_column].isin(required_periods)],
+        date_column=date_column,
+        category_column=category_column,
+    )
+
+    sort_columns = {
+        'market_totals_df': ['Account', date_column],
+    }
+    updated = {}
+    for key, sort_by in sort_columns.items():
+        old_df = aggregates[key]
+        new_df = recalculated[key]
+        updated[key] = pd.concat([
+            old_df[~old_df[date_column].isin(recalculate_periods | set(affected_periods))],
+            new_df[new_df[date_column].isin(recalculate_periods)],
+        ], ignore_index=True).sort_values(by=sort_by).reset_index(drop=True)
+
+    updated['panel_cube'] = build_panel_cube(
+        df=df,
+        market_totals_df=updated['market_totals_df'],
+        date_column=date_column,
+        category_column=category_column,
+        previous_cube=aggregates['panel_cube'],
+        affected_periods=affected_periods,
+    )
+
+    return updated
+
+def incremental_data_loader(
+        config_dict,
+        file_name,
+        date_column,
+        category_column,
+        process_fn,
+):
+    """
+    Load the dataset, updating the persisted dataset from the file rather than
+    rebuilding it where possible.
+
+    Only the last revision_window_months of the file are read and compared with
+    the persisted dataset. New and revised periods replace the persisted rows,
+    and the derived aggregates are only recalculated for those periods.
+
+    Parameters:
+        config_dict (dict): The loaded config.yaml.
+        file_name (str): The xlsx file.
+        date_column (str): The period column.
+        category_column (str): The institution column.
+        process_fn (callable): Reads and processes the file, called with min_date
+            (None to read the whole file).
+
+    Returns:
+        dict: The manifest, 'df', 'market_totals_df' and 'panel_cube' (see panel_cube.build_panel_cube).
+    """
+    cache_details = config_dict.get('data_cache', {})
+    key_columns = cache_details.get('key_columns', [category_column])
+    manifest = {
+        'source_hash': file_content_hash(file_name),
+        'config_hash': processing_config_hash(config_dict),
+    }
+
+    persisted = read_persisted_dataset(config_dict)
+    if (persisted is not None) and (persisted['manifest'].get('config_hash') == manifest['config_hash']):
+        # Unchanged file
+        if persisted['manifest'].get('source_hash') == manifest['source_hash']:
+            logger.debug("Persisted dataset is up to date")
+            return persisted
+
+        # Read the latest months of the new file and apply them
+        window_start = persisted['df'][date_column].max() - relativedelta(
+            months=cache_details.get('revision_window_months', 12)
+        )
+        window_start = pd.Timestamp(window_start) + pd.offsets.MonthEnd(0)
+        df, affected_periods = merge_period_update(
+            persisted_df=persisted['df'],
+            window_df=process_fn(min_date=window_start),
+            date_column=date_column,
+            key_columns=key_columns,
+            window_start=window_start,
+        )
+        aggregates = update_market_aggregates(
+            aggregates=persisted,
+            df=df,
+            affected_periods=affected_periods,
+            date_column=date_column,
+            category_column=category_column,
+        )
+        logger.info(f"Incremental update of {len(affected_periods)} periods: {[str(period.date()) for period in affected_periods]}")
+    else:
+        # Full rebuild
+        df = process_fn(min_date=None).reset_index(drop=True)
+        aggregates = market_aggregates(
+            df=df,
+            date_column=date_column,
+            category_column=category_column,
+        )
+        aggregates['panel_cube'] = build_panel_cube(
+            df=df,
+            market_totals_df=aggregates['market_totals_df'],
+            date_column=date_column,
+            category_column=category_column,
+        )
+        logger.info("Full rebuild of the persisted dataset")
+
+    persisted = {'manifest': manifest, 'df': df}
+    persisted.update(aggregates)
+    write_persisted_dataset(config_dict, persisted)
+
+    return persisted
@@ -0,0 +1,352 @@
+import importlib.util
+import logging
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+from pd_data_frame_checks import check_columns_existence, convert_columns_dict_type_allocation
+
+logger = logging.getLogger(__name__)
+
+# Rows allocated when the sheet does not report its dimensions
+DEFAULT_BUFFER_ROWS = 1024
+
+def header_column_names(header_row):
+    """
+    Get the column names from a header row, named as pd.read_excel would.
+
+    Trailing empty header cells are dropped and empty header cells within the
+    row are named 'Unnamed: <position>'.
+    """
+    header_row = list(header_row)
+    while header_row and (header_row[-1] is None):
+        header_row.pop()
+
+    return [
+        f'Unnamed: {position}' if (name is None) else str(name)
+        for position, name in enumerate(header_row)
+    ]
+
+def column_buffer_types(
+        column_names,
+        col_types_dict,
+):
+    """
+    Get the buffer type for each column, following the same rules as
+    pd_data_frame_checks.convert_columns_dict_type_allocation.
+    """
+    buffer_types = {}
+    for key, cols in col_types_dict.items():
+        if key in ['skip_cols', 'else_cols_as_type']:
+            continue
+        for col in cols:
+            buffer_types[col] = key
+
+    else_type = col_types_dict.get('else_cols_as_type')
+    return [buffer_types.get(col, else_type) for col in column_names]
+
+def to_float(value):
+    if value is None:
+        return np.nan
+    return float(value)
+
+def to_str(value):
+    # Empty cells are NaN in pd.read_excel, which convert to 'nan'
+    if value is None:
+        return 'nan'
+    return str(value)
+
+def to_date(value):
+    if value is None:
+        return np.datetime64('NaT')
+    return np.datetime64(pd.Timestamp(value).normalize(), 'ns')
+
+BUFFER_DETAILS = {
+    'float': (np.float64, to_float),
+    'str': (object, to_str),
+    'date': ('datetime64[ns]', to_date),
+}
+
+def allocate_buffers(
+        buffer_types,
+        rows,
+        buffers=None,
+):
+    """
+    Allocate (or grow) a buffer for each column.
+
+    The float columns share one 2D block, each column being a row of the block,
+    which pandas can use as the DataFrame's float block without copying.
+
+    Returns:
+        tuple: The float block and the list of column buffers.
+    """
+    for buffer_type in buffer_types:
+        if buffer_type not in BUFFER_DETAILS:
+            raise ValueError('Unexpected data type. Supported types are: "date", "str", "float".')
+
+    float_positions = [position for position, buffer_type in enumerate(buffer_types) if buffer_type == 'float']
+    float_block = np.empty((len(float_positions), rows), dtype=np.float64)
+
+    new_buffers = []
+    for position, buffer_type in enumerate(buffer_types):
+        if buffer_type == 'float':
+            new_buffer = float_block[float_positions.index(position)]
+        else:
+            new_buffer = np.empty(rows, dtype=BUFFER_DETAILS[buffer_type][0])
+
+        # Keep the values already read when growing the buffers
+        if buffers is not None:
+            new_buffer[:len(buffers[position])] = buffers[position]
+        new_buffers.append(new_buffer)
+
+    return float_block, new_buffers
+
+def buffers_to_df(
+        column_names,
+        buffer_types,
+        float_block,
+        buffers,
+        row_count,
+):
+    # Use the float block as the DataFrame's values, then add the other columns in position
+    float_columns = [column for column, buffer_type in zip(column_names, buffer_types) if buffer_type == 'float']
+    df = pd.DataFrame(float_block[:, :row_count].T, columns=float_columns, copy=False)
+    for position, (column, buffer_type) in enumerate(zip(column_names, buffer_types)):
+        if buffer_type != 'float':
+            df.insert(position, column, buffers[position][:row_count])
+
+    return df
+
+def read_excel_streaming(
+        file_name,
+        sheet_name,
+        skiprows,
+        expected_columns_list,
+        col_types_dict,
+        date_column,
+        min_date=None,
+        rows_newest_first: bool = False,
+):
+    """
+    Read a sheet row by row into typed NumPy column buffers.
+
+    The workbook is opened in read-only mode, so rows are streamed from the file
+    rather than loading the whole sheet. The returned DataFrame matches reading
+    the sheet with pd.read_excel, sorting by the date column and converting the
+    column types with convert_columns_dict_type_allocation.
+
+    Parameters:
+        file_name (str): The xlsx file to read.
+        sheet_name (str): The sheet to read.
+        skiprows (int): Number of rows before the header row.
+        expected_columns_list (list): Columns which must exist in the header row.
+        col_types_dict (dict): Column types - see config.yaml column_typing_dict.
+        date_column (str): Column the rows are sorted by.
+        min_date (datetime): Optional, rows before this date are not read.
+        rows_newest_first (bool): The sheet is sorted newest date first, so reading
+            can stop at the first row before min_date.
+
+    Returns:
+        pd.DataFrame: The typed DataFrame.
+    """
+    logger.debug(f"Executing: read_excel_streaming {file_name}")
+
+    workbook = load_workbook(filename=file_name, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet_name]
+        rows = worksheet.iter_rows(min_row=skiprows + 1, values_only=True)
+
+        # Header row
+        column_names = header_column_names(next(rows, ()))
+        check_columns_existence(
+            df=pd.DataFrame(columns=column_names),
+            target_columns=expected_columns_list,
+        )
+        no_columns = len(column_names)
+        date_position = column_names.index(date_column)
+        if min_date is not None:
+            min_date = pd.Timestamp(min_date)
+
+        # Preallocate the column buffers, using the sheet dimensions if available
+        buffer_types = column_buffer_types(column_names, col_types_dict)
+        converters = [BUFFER_DETAILS[buffer_type][1] for buffer_type in buffer_types]
+        max_row = worksheet.max_row
+        buffer_rows = (max_row - skiprows - 1) if max_row else DEFAULT_BUFFER_ROWS
+        buffer_rows = max(buffer_rows, 1)
+        float_block, buffers = allocate_buffers(buffer_types, buffer_rows)
+
+        # Fill buffers
+        row_count = 0
+        for row in rows:
+            row = row[:no_columns]
+            if all(value is None for value in row):
+                continue
+
+            # Skip rows before min_date
+            if (min_date is not None) and (row[date_position] is not None) and (pd.Timestamp(row[date_position]) < min_date):
+                if rows_newest_first:
+                    break
+                continue
+
+            # Grow buffers if the sheet dimensions were wrong
+            if row_count == buffer_rows:
+                buffer_rows = buffer_rows * 2
+                float_block, buffers = allocate_buffers(buffer_types, buffer_rows, buffers)
+
+            for position, value in enumerate(row):
+                buffers[position][row_count] = converters[position](value)
+            for position in range(len(row), no_columns):
+                buffers[position][row_count] = converters[position](None)
+            row_count += 1
+    finally:
+        workbook.close()
+
+    df = buffers_to_df(
+        column_names=column_names,
+        buffer_types=buffer_types,
+        float_block=float_block,
+        buffers=buffers,
+        row_count=row_count,
+    )
+
+    # Sort by date column
+    df.sort_values(by=date_column, inplace=True)
+
+    logger.debug(f"Executed: read_excel_streaming {row_count} rows")
+    return df
+
+def read_excel_pandas(
+        file_name,
+        sheet_name,
+        skiprows,
+        expected_columns_list,
+        col_types_dict,
+        date_column,
+        min_date=None,
+        rows_newest_first: bool = False,
+        pandas_engine: str = 'openpyxl',
+):
+    """
+    Read a sheet with pd.read_excel, then sort and convert the column types, with
+    date columns as datetime64 and integers in str columns without a decimal point
+    (matching read_excel_streaming).
+
+    Parameters are as for read_excel_streaming, plus:
+        pandas_engine (str): The pd.read_excel engine - 'openpyxl' or 'calamine'.
+    """
+    # Read the Excel file into a DataFrame - str columns as the cell values, so integers
+    # (e.g. ABNs) are not read as floats in a column with empty cells
+    df = pd.read_excel(
+        io=file_name,
+        sheet_name=sheet_name,
+        skiprows=skiprows,
+        engine=pandas_engine,
+        dtype={column: object for column in (col_types_dict.get('str') or [])},
+    )
+
+    # Check expected columns exist
+    check_columns_existence(
+        df=df,
+        target_columns=expected_columns_list,
+    )
+
+    # Filter out rows before min_date
+    if min_date is not None:
+        df = df[pd.to_datetime(df[date_column]) >= pd.Timestamp(min_date)].copy()
+
+    # Sort by date column
+    df.sort_values(by=date_column, inplace=True)
+
+    # Column Data Types
+    df=convert_columns_dict_type_allocation(
+        df=df,
+        col_types_dict=col_types_dict,
+    )
+
+    # Dates as datetime64, as read_excel_streaming returns them, rather than datetime.date objects
+    for column, buffer_type in zip(df.columns, column_buffer_types(list(df.columns), col_types_dict)):
+        if buffer_type == 'date':
+            df[column] = pd.to_datetime(df[column])
+
+    return df
+
+def read_excel_openpyxl(**kwargs):
+    return read_excel_pandas(pandas_engine='openpyxl', **kwargs)
+
+def read_excel_calamine(**kwargs):
+    return read_excel_pandas(pandas_engine='calamine', **kwargs)
+
+# Available engines, and the order they are tried in for 'auto' (fastest first)
+INGEST_ENGINES = {
+    'calamine': read_excel_calamine,
+    'streaming': read_excel_streaming,
+    'openpyxl': read_excel_openpyxl,
+}
+
+def engine_available(engine):
+    if engine == 'calamine':
+        # calamine is an optional dependency
+        return importlib.util.find_spec('python_calamine') is not None
+    return engine in INGEST_ENGINES
+
+def engine_order(engine: str = 'auto'):
+    """
+    Get the engines to try, in order.
+
+    The selected engine is tried first, then the remaining engines as a fallback.
+    'auto' tries every engine, fastest first. Unavailable engines are skipped.
+    """
+    if (engine != 'auto') and (engine not in INGEST_ENGINES):
+        raise ValueError(f"Error: unknown file loading engine '{engine}', use 'auto' or one of {list(INGEST_ENGINES)}")
+
+    engines = list(INGEST_ENGINES)
+    if engine != 'auto':
+        engines.remove(engine)
+        engines.insert(0, engine)
+
+    return [engine for engine in engines if engine_available(engine)]
+
+def read_excel_data(
+        file_name,
+        file_loading_details,
+        col_types_dict,
+        date_column,
+        min_date=None,
+):
+    """
+    Read and type the data sheet, using the engine selected in file_loading_details
+    and falling back to the other engines if it fails.
+
+    Parameters:
+        file_name (str): The xlsx file to read.
+        file_loading_details (dict): See config.yaml file_loading_details.
+        col_types_dict (dict): Column types - see config.yaml column_typing_dict.
+        date_column (str): Column the rows are sorted by.
+        min_date (datetime): Optional, only rows from this date onwards are returned.
+
+    Returns:
+        tuple: The typed DataFrame, and the name of the engine used.
+    """
+    last_error = None
+    for engine in engine_order(file_loading_details.get('engine', 'auto')):
+        try:
+            df = INGEST_ENGINES[engine](
+                file_name=file_name,
+                sheet_name=file_loading_details['sheet_name'],
+                skiprows=file_loading_details['skiprows'],
+                expected_columns_list=file_loading_details['expected_columns_list'],
+                col_types_dict=col_types_dict,
+                date_column=date_column,
+                min_date=min_date,
+                rows_newest_first=file_loading_details.get('rows_newest_first', False),
+            )
+            logger.debug(f"Read {file_name} with the {engine} engine")
+            return df, engine
+        except Exception as e:
+            logger.info(f"The {engine} engine failed to read {file_name}: {e}")
+            last_error = e
+
+    if last_error is None:
+        raise ValueError("Error: no file loading engines are available")
+    raise last_error
@@ -1,18 +1,23 @@
+import os
 import pandas as pd
 import logging
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 from urllib.parse import quote
-import requests
 
 from utils import read_yaml
 from data_processing.business_loans.business_loans import business_loans_fn
-from pd_data_frame_checks import check_columns_existence, convert_columns_dict_type_allocation, column_adjustments
+from pd_data_frame_checks import column_adjustments
 from utils_dataframe_calcs import new_calculated_column
+from data_download import download_file
+from data_ingest import read_excel_data
+from data_cache import data_cache_enabled, data_cache_key, read_cached_df, write_cached_df
+from data_incremental import incremental_data_loader, market_aggregates
+from instrumentation import instrumented
 
 logger = logging.getLogger(__name__)
 
-def load_url_xlsx():
+def madis_url_details():
     base_url = 'https://www.apra.gov.au/sites/default/files/'
     last_month_eom = datetime.now().replace(day=1) - timedelta(days=1)
     last_month_yyyy_mm = last_month_eom.strftime('%Y-%m')
@@ -24,52 +29,48 @@ def load_url_xlsx():
     # Concatenate the strings to form the full URL
     full_url = base_url + last_month_yyyy_mm + file_path + quote(two_months_ago_mmm_yyyy) + file_extension
 
-    try:
-        # Set xlsx path
-        file_name = f"data/madis_{two_months_ago_mmm_yyyy}.xlsx".replace(' ', '_')
+    # Set xlsx path
+    file_name = f"data/madis_{two_months_ago_mmm_yyyy}.xlsx".replace(' ', '_')
 
-        # Attempt to load URL xlsx
-        response = requests.get(full_url)
-        response.raise_for_status()  # This will raise an exception if there is an error
+    return full_url, file_name
 
-        with open(file_name, 'wb') as f:
-            f.write(response.content)
+def load_url_xlsx(
+        download_details=None,
+):
+    full_url, file_name = madis_url_details()
 
-        logger.debug(f"File downloaded successfully! file_name:{file_name}")
+    try:
+        # Attempt to load URL xlsx - only downloaded if changed since the last download
+        download_file(
+            url=full_url,
+            file_name=file_name,
+            download_details=download_details,
+        )
     except Exception as e:
         logger.info(f"Failed to download the file: {e}")
 
-        # Set xlsx path
-        file_name = 'data/Monthly authorised deposit-taking institution statistics back-series March 2019 - December 2023.xlsx'
+        # Keep using a previously downloaded copy if there is one
+        if not os.path.exists(file_name):
+            # Set xlsx path
+            file_name = 'data/Monthly authorised deposit-taking institution statistics back-series March 2019 - December 2023.xlsx'
         logger.info(f"Using alternative file: {file_name}")
     
     return file_name
 
+@instrumented
 def read_and_process_data(
         config_dict,
         file_name,
         date_column,
+        min_date=None,
 ):
-    # Read the Excel file into a DataFrame
-    df = pd.read_excel(
-        io=file_name,
-        sheet_name=config_dict['file_loading_details']['sheet_name'],
-        skiprows=config_dict['file_loading_details']['skiprows'],
-    )
-
-    # Sort by date column
-    df.sort_values(by=date_column, inplace=True)
-
-    # Check expected columns exist
-    check_columns_existence(
-        df=df,
-        target_columns=config_dict['file_loading_details']['expected_columns_list']
-    )
-
-    # Column Data Types
-    df=convert_columns_dict_type_allocation(
-        df=df.copy(),
+    # Read and type the data, using the engine set in config.yaml
+    df, engine = read_excel_data(
+        file_name=file_name,
+        file_loading_details=config_dict['file_loading_details'],
         col_types_dict=config_dict['column_typing_dict'],
+        date_column=date_column,
+        min_date=min_date,
     )
 
     # Column Adjustments - convert to dollar amounts (not scalled)
@@ -80,24 +81,10 @@ def read_and_process_data(
     return df
 
 
-def data_loader():
-    logger.debug("Executing: data_loader")
-     # to do: generate logs to see what columns are converted to what - datetime col issues
-
-    # Read config
-    config_dict = read_yaml(file_path = 'config.yaml')
-    date_column = 'Period'
-
-    # Load data
-    file_name=load_url_xlsx()
-
-    # Read and process data
-    df = read_and_process_data(
-        config_dict=config_dict,
-        file_name=file_name,
-        date_column=date_column,        
-    )
-
+def add_calculated_columns(
+        df,
+        config_dict,
+):
     # Create calculated columns
     for new_column_name, calculations in config_dict['calculated_columns'].items():
         df[new_column_name] = 0
@@ -111,5 +98,90 @@ def data_loader():
                 column=column,
             )
 
-    logger.debug("Executed: data_loader")
+    return df
+
+@instrumented
+def dataset_loader(
+        with_aggregates: bool = False,
+):
+    """
+    Load the processed dataset.
+
+    Parameters:
+        with_aggregates (bool): Also return the derived market aggregates.
+
+    Returns:
+        tuple: The DataFrame, the source file name and a dict of the market aggregates
+        ('market_totals_df', and 'panel_cube' if updated with the persisted dataset),
+        which is None unless requested.
+    """
+    logger.debug("Executing: dataset_loader")
+     # to do: generate logs to see what columns are converted to what - datetime col issues
+
+    # Read config
+    config_dict = read_yaml(file_path = 'config.yaml')
+    date_column = 'Period'
+    category_column = 'Institution Name'
+
+    # Load data
+    file_name=load_url_xlsx(
+        download_details=config_dict.get('download_details'),
+    )
+
+    def process_fn(min_date=None):
+        # Read and process data
+        df = read_and_process_data(
+            config_dict=config_dict,
+            file_name=file_name,
+            date_column=date_column,
+            min_date=min_date,
+        )
+
+        # Create calculated columns
+        return add_calculated_columns(
+            df=df,
+            config_dict=config_dict,
+        )
+
+    # Update the persisted dataset, only processing new and revised periods
+    if data_cache_enabled(config_dict) and config_dict['data_cache'].get('incremental', False):
+        persisted = incremental_data_loader(
+            config_dict=config_dict,
+            file_name=file_name,
+            date_column=date_column,
+            category_column=category_column,
+            process_fn=process_fn,
+        )
+        aggregates = {key: persisted[key] for key in ['market_totals_df', 'panel_cube']}
+        logger.debug("Executed: dataset_loader (incremental)")
+        return persisted['df'], file_name, aggregates
+
+    # Use the cached processed data if the file and config are unchanged
+    df = None
+    cache_key = None
+    if data_cache_enabled(config_dict):
+        cache_key = data_cache_key(config_dict=config_dict, file_name=file_name)
+        df = read_cached_df(config_dict=config_dict, cache_key=cache_key)
+
+    if df is None:
+        df = process_fn()
+
+        # Save the processed data for the next run
+        if cache_key is not None:
+            write_cached_df(df=df, config_dict=config_dict, cache_key=cache_key)
+
+    aggregates = None
+    if with_aggregates:
+        aggregates = market_aggregates(
+            df=df,
+            date_column=date_column,
+            category_column=category_column,
+        )
+
+    logger.debug("Executed: dataset_loader")
+    return df, file_name, aggregates
+
+@instrumented
+def data_loader():
+    df, file_name, _ = dataset_loader()
     return df, file_name
@@ -1,4 +1,5 @@
 from utils import read_yaml
+from utils_dataframe_calcs import grouped_movements
 import logging
 import numpy as np
 from math import isnan
@@ -39,31 +40,6 @@ def apply_current_ranking(
 
 
 
-def movement_fn(
-        df,
-        unique_id_col,
-        movement_column,
-):
-    for abn in df[unique_id_col].unique():
-        # Create mask for the unique id
-        unique_id_mask = df[unique_id_col] == abn
-
-        # Get dollar movements
-        mom_dollar_col = movement_column + ' - MoM ($)'
-        df.loc[unique_id_mask, mom_dollar_col] = df.loc[unique_id_mask, movement_column].diff()
-        # Set NaN for the first row since there's no previous month
-        df.loc[unique_id_mask & df.index.isin([df.loc[unique_id_mask].index[0]]), mom_dollar_col] = None
-
-        # Get percentage movements
-        mom_percentage_col = movement_column + ' - MoM (%)'
-        df.loc[unique_id_mask, mom_percentage_col] = (df.loc[unique_id_mask, mom_dollar_col] / df.loc[unique_id_mask, movement_column].shift(1))
-         
-        # Get direction of movement
-        movement_direction = np.where(df.loc[unique_id_mask, mom_dollar_col] < 0, 'decrease', np.where(df.loc[unique_id_mask, mom_dollar_col] > 0, 'increase', 'none'))
-        df.loc[unique_id_mask, 'Movement Direction'] = movement_direction
-
-    return df
-
 def business_loans_fn(
         rba_monthly_stats_df,
 ):
@@ -83,11 +59,11 @@ def business_loans_fn(
         ranking_column = 'ranking',
     )
 
-    bb_df=movement_fn(
+    bb_df=grouped_movements(
         df=bb_df,
-        unique_id_col='ABN',
-        movement_column='Business Loans',
-    )
+        group_column='ABN',
+        movement_columns=['Business Loans'],
+    ).rename(columns={'Business Loans - MoM Movement Direction': 'Movement Direction'})
 
     # bb_df['Business Loans - dollars text'] = bb_df['Business Loans'].apply(rounded_dollars)
     # bb_df['Business Loans - MoM ($) - dollars text'] = bb_df['Business Loans - MoM ($)'].apply(rounded_dollars)
@@ -4,6 +4,10 @@ import streamlit as st
 import numpy as np
 import datetime as dt
 
+from utils_dataframe_calcs import as_at_date
+from panel_cube import cube_ranked_categories
+from instrumentation import instrumented
+
 logger = logging.getLogger(__name__)
 
 def date_selection(
@@ -79,34 +83,48 @@ def top_x_selection(
         selected_category,
         selected_column,
         default_x_value = None,
+        panel_cube = None,
+        dates_sorted = False,
 ):
-    current_df = df[df[date_column] == selected_date][[category_column, selected_column]].sort_values(by=selected_column, ascending=False)
+    # Categories at the selected date, largest first - presorted in the panel cube if available
+    if panel_cube is not None:
+        ranked_category_list = cube_ranked_categories(
+            cube=panel_cube,
+            selected_column=selected_column,
+            selected_date=selected_date,
+        )
+    else:
+        current_df = as_at_date(df, date_column, selected_date, dates_sorted=dates_sorted)[[category_column, selected_column]].sort_values(by=selected_column, ascending=False)
+        ranked_category_list = current_df[category_column].tolist()
 
     # Define default_x_value if not set
     if default_x_value == None:
-        default_x_value=int(len(current_df)/5)
+        default_x_value=int(len(ranked_category_list)/5)
 
     # Create a slider widget with the unique values from the column
-    top_x_value = st.slider('Select Top x', 1, len(current_df), default_x_value, 1)
+    top_x_value = st.slider('Select Top x', 1, len(ranked_category_list), default_x_value, 1)
 
     # Filter the data based on the selected option
-    top_x_category_list = current_df.iloc[0:(top_x_value+1) , :][category_column].tolist()
+    top_x_category_list = ranked_category_list[0:(top_x_value+1)]
 
     # Add selected category to list incase it isnt present
     top_x_category_list.append(selected_category)
 
-    # Ensure list has only unique values
-    top_x_category_list = list(set(top_x_category_list))
+    # Ensure list has only unique values, in a fixed order so the filter cache keys are stable
+    top_x_category_list = sorted(set(top_x_category_list))
 
     return top_x_value, top_x_category_list
 
+@instrumented
 def select_data_filters(
         df,
         date_column,
         group_by_columns,
         default_column,
         category_column,
-        default_category
+        default_category,
+        panel_cube = None,
+        dates_sorted = False,
 ):
     """
     This returns the filter selections made to apply to the data.
@@ -135,7 +153,7 @@ def select_data_filters(
     # Select Category
     selected_category = category_selection(
         # only select categories from the relevant date selected
-        df=df[df[date_column] == selected_date],
+        df=as_at_date(df, date_column, selected_date, dates_sorted=dates_sorted),
         category_column=category_column,
         default_category=default_category,
         col3=col3,
@@ -153,6 +171,8 @@ def select_data_filters(
         selected_category=selected_category,
         selected_column=selected_column,
         default_x_value = 15,
+        panel_cube = panel_cube,
+        dates_sorted = dates_sorted,
     )
 
     logger.debug("Executed: select_data_filters")
@@ -0,0 +1,106 @@
+import logging
+import os
+import time
+from types import MappingProxyType
+
+import streamlit as st
+
+from utils import read_yaml
+from data_loading import dataset_loader, madis_url_details
+from panel_cube import build_panel_cube
+from utils_dataframe_calcs import freeze_dataframe
+from instrumentation import instrumented
+
+logger = logging.getLogger(__name__)
+
+# How often to retry loading while the latest APRA file is not yet available
+DOWNLOAD_RETRY_SECONDS = 60 * 60
+
+def shared_data_version():
+    """
+    Version of the APRA data the shared cache should hold.
+
+    This only checks the local file system, so it is cheap to call on every rerun.
+    A newly downloaded APRA file changes the version, which reloads the shared data.
+    """
+    _, file_name = madis_url_details()
+    if os.path.exists(file_name):
+        return f"{file_name}:{os.path.getmtime(file_name)}"
+
+    # The latest file is not available yet - retry periodically
+    return f"{file_name}:missing:{int(time.time() // DOWNLOAD_RETRY_SECONDS)}"
+
+@st.cache_resource(max_entries=1, show_spinner='Loading APRA data...')
+def _load_shared_data(
+        data_version,
+        exclude_columns,
+):
+    logger.debug(f"Executing: _load_shared_data (data_version:{data_version})")
+
+    # Get data
+    df, file_name, aggregates = dataset_loader(with_aggregates=True)
+    df = df.drop(columns=list(exclude_columns))
+
+    # Sorted by date, so date filters are binary searched slices - see utils_dataframe_calcs.as_at_date
+    df = df.sort_values(by=['Period', 'Institution Name'], kind='stable', ignore_index=True)
+
+    # Checked once here, rather than on every date filter
+    dates_sorted = bool(df['Period'].is_monotonic_increasing)
+
+    # Shared between all sessions, so ensure it is not modified
+    df = freeze_dataframe(df)
+    market_totals_df = freeze_dataframe(aggregates['market_totals_df'])
+
+    # Dense arrays of the dataset and aggregates, so switching account is array slicing -
+    # updated with the persisted dataset if loaded incrementally
+    panel_cube = aggregates.get('panel_cube')
+    if panel_cube is None:
+        panel_cube = build_panel_cube(
+            df=df,
+            market_totals_df=market_totals_df,
+            date_column='Period',
+            category_column='Institution Name',
+        )
+
+    shared_data = {
+        'df': df,
+        'file_name': file_name,
+        'data_version': data_version,
+        'dates_sorted': dates_sorted,
+        'market_totals_df': market_totals_df,
+        'panel_cube': MappingProxyType(panel_cube),
+        'filter_cache_details': MappingProxyType(read_yaml(file_path = 'config.yaml').get('filter_cache', {})),
+        'figure_cache_details': MappingProxyType(read_yaml(file_path = 'config.yaml').get('figure_cache', {})),
+        'chart_pool_details': MappingProxyType(read_yaml(file_path = 'config.yaml').get('chart_pool', {})),
+        'aliases_dict': MappingProxyType(read_yaml(file_path = 'aliases.yaml')),
+        'color_discrete_map': MappingProxyType(read_yaml(file_path = 'color_discrete_map.yaml')),
+    }
+
+    logger.debug("Executed: _load_shared_data")
+    return MappingProxyType(shared_data)
+
+@instrumented
+def get_shared_data(
+        exclude_columns = (),
+):
+    """
+    Get the dataset and configs shared by all sessions of this server process.
+
+    Parameters:
+        exclude_columns (iterable): Columns dropped from the loaded data.
+
+    Returns:
+        MappingProxyType: Read-only mapping of 'df', 'file_name', 'data_version',
+        'dates_sorted' (whether df is sorted by date), 'market_totals_df', 'panel_cube', 'filter_cache_details',
+        'figure_cache_details', 'chart_pool_details', 'aliases_dict' and 'color_discrete_map'.
+        The DataFrame values are read-only.
+    """
+    return _load_shared_data(
+        data_version=shared_data_version(),
+        exclude_columns=tuple(exclude_columns),
+    )
+
+def invalidate_shared_data():
+    """Drop the shared data, so the next rerun reloads it."""
+    logger.info("Invalidating shared data")
+    _load_shared_data.clear()
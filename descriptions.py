@@ -5,6 +5,7 @@ from dateutil.relativedelta import relativedelta
 from utils import movement_values, rounded_dollars, rounded_dollars_md, escape_dollar_signs
 from utils import percentage_to_string, period_ago, get_months_ago_list
 from utils import ranking_position, position_s_movement
+from instrumentation import instrumented
 
 # Setup logging
 logger = logging.getLogger(__name__)
@@ -137,6 +138,7 @@ def balance_movements_graph_text(
     
     return balance_description
 
+@instrumented
 def generate_descriptions(
         dfs_dict,
         date_column,
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections.abc import Mapping
+
+import pandas as pd
+import plotly
+import plotly.graph_objects as go
+
+from filter_cache import cache_key
+from instrumentation import span
+from utils import project_absolute_path, atomic_write, details_with_defaults
+
+logger = logging.getLogger(__name__)
+
+# Default cache settings, overridden by figure_cache in config.yaml
+DEFAULT_FIGURE_CACHE_DETAILS = {
+    'enabled': True,
+    'directory': 'cache/figures',
+    'max_megabytes': 256,
+}
+
+# Bump when the charts change, so previously cached figures are not used
+FIGURE_CACHE_FORMAT = 1
+
+# Evictions by this process - other processes may evict from the same directory
+_figure_cache_lock = threading.Lock()
+
+def figure_cache_directory(cache_details):
+    # Relative directories are within the project
+    directory = os.path.join(project_absolute_path(), cache_details['directory'])
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+def key_value(value):
+    # JSON-able stand in for a chart argument - DataFrames by the hash of their contents
+    if isinstance(value, pd.DataFrame):
+        row_hashes = pd.util.hash_pandas_object(value, index=False).to_numpy()
+        return [list(map(str, value.columns)), list(map(str, value.dtypes)), hashlib.sha256(row_hashes.tobytes()).hexdigest()]
+    if isinstance(value, Mapping):
+        return sorted([str(key), key_value(item)] for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return [key_value(item) for item in value]
+    return value
+
+def figure_key(
+        chart,
+        data_version,
+):
+    """
+    Content address of a chart - the hash of its type and arguments (with the data
+    shown), the dataset version, the plotly version and FIGURE_CACHE_FORMAT.
+    """
+    chart_kwargs = chart.chart_kwargs
+    return cache_key([
+        'figure',
+        FIGURE_CACHE_FORMAT,
+        plotly.__version__,
+        str(data_version),
+        type(chart).__name__,
+        [[name, key_value(chart_kwargs[name])] for name in sorted(chart_kwargs)],
+    ])
+
+def figure_cache_evict(
+        directory,
+        max_bytes,
+):
+    # Remove the least recently used figures until within max_bytes
+    entries = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith('.json'):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Already removed by another process
+            pass
+        total_bytes -= size
+
+def read_cached_figure(path):
+    # The cached figure's JSON, or None if not cached
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            figure_json = f.read()
+    except FileNotFoundError:
+        return None
+
+    # Mark as recently used, for eviction
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+    return figure_json
+
+def write_cached_figure(
+        path,
+        figure_json,
+):
+    # Written to a temporary file then renamed, so other processes never read part of a figure
+    atomic_write(
+        file_name=path,
+        write_fn=lambda f: f.write(figure_json),
+        mode='w',
+        encoding='utf-8',
+    )
+
+def cached_figure(
+        chart,
+        data_version,
+        cache_details=None,
+):
+    """
+    Get a chart's figure, from the figure cache if it has been built before - by
+    this or another server process sharing the cache directory.
+
+    Figures are stored as JSON files named by their content address (see figure_key),
+    and the least recently used are removed once the directory exceeds max_megabytes.
+
+    Parameters:
+        chart (chart_generator.LazyChart): The chart (or a subclass, e.g. TimelineChart).
+        data_version (str): Version of the dataset - see data_store.shared_data_version.
+        cache_details (dict): Cache settings - see DEFAULT_FIGURE_CACHE_DETAILS.
+
+    Returns:
+        plotly.graph_objects.Figure: The chart's figure.
+    """
+    details = details_with_defaults(DEFAULT_FIGURE_CACHE_DETAILS, cache_details)
+    if not details['enabled']:
+        return chart.figure()
+
+    def load_or_build():
+        with span('cached_figure') as figure_span:
+            directory = figure_cache_directory(details)
+            key = figure_key(chart=chart, data_version=data_version)
+            path = os.path.join(directory, f'{key}.json')
+
+            figure_json = read_cached_figure(path)
+            if figure_json is not None:
+                figure_span['cached'] = True
+                logger.debug(f"Figure cache hit: {key[:12]}")
+                # Saved from a built figure, so not validated again
+                return go.Figure(json.loads(figure_json), _validate=False)
+
+            figure_span['cached'] = False
+            fig = chart.build()
+            try:
+                write_cached_figure(path, fig.to_json())
+                with _figure_cache_lock:
+                    figure_cache_evict(
+                        directory=directory,
+                        max_bytes=float(details['max_megabytes']) * 1024 * 1024,
+                    )
+            except OSError as e:
+                # Not cached, but the figure is still shown
+                logger.warning(f"Figure cache write failed: {e}")
+            logger.debug(f"Figure cache miss: {key[:12]}")
+            return fig
+
+    return chart.figure(build_figure=load_or_build)
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import logging
+import sys
+import threading
+from collections import OrderedDict
+from types import MappingProxyType
+
+import numpy as np
+import pandas as pd
+
+from utils import details_with_defaults
+from utils_dataframe_calcs import freeze_dataframe
+
+logger = logging.getLogger(__name__)
+
+# Default cache limits, overridden by filter_cache in config.yaml
+DEFAULT_FILTER_CACHE_DETAILS = {
+    'enabled': True,
+    'max_entries': 128,
+    'max_megabytes': 256,
+}
+
+# Pipeline stage results shared by all sessions, least recently used first - see pipeline.run_pipeline
+_filter_data_cache = OrderedDict()
+_filter_data_cache_lock = threading.Lock()
+
+def cache_key(key_parts):
+    # Stable hash of the key parts
+    return hashlib.sha256(json.dumps(key_parts, default=str).encode('utf-8')).hexdigest()
+
+def numpy_values(values):
+    # The numpy array behind a Series or Index, or None for extension dtypes (which would be copied)
+    if isinstance(values.dtype, np.dtype):
+        return values.to_numpy()
+    return None
+
+def shared_arrays(value):
+    """
+    Get the numpy arrays of the DataFrames and arrays in value, so views of them
+    (e.g. date slices of the shared dataset) can be excluded from result sizes.
+    """
+    if isinstance(value, np.ndarray):
+        return [value]
+    if isinstance(value, pd.DataFrame):
+        arrays = [numpy_values(value.index)]
+        arrays += [numpy_values(value.iloc[:, position]) for position in range(value.shape[1])]
+        return [array for array in arrays if array is not None]
+    if isinstance(value, (dict, MappingProxyType)):
+        return [array for item in value.values() for array in shared_arrays(item)]
+    if isinstance(value, (list, tuple)):
+        return [array for item in value for array in shared_arrays(item)]
+    return []
+
+def shares_memory(
+        values,
+        arrays,
+):
+    # Overlapping memory bounds - separately allocated arrays cannot overlap, and unlike
+    # np.shares_memory this does not search strided arrays for a common element
+    array = numpy_values(values)
+    return (array is not None) and any(np.may_share_memory(array, shared_array) for shared_array in arrays)
+
+def dataframe_nbytes(
+        df,
+        arrays=(),
+):
+    # Memory used by the index and each column, excluding views of arrays
+    try:
+        usage = df.memory_usage(index=True, deep=True)
+    except ValueError:
+        # Object columns of read-only DataFrames can only be measured shallowly
+        usage = df.memory_usage(index=True, deep=False)
+    if not arrays:
+        return int(usage.sum())
+
+    nbytes = int(usage.iloc[0]) if not shares_memory(df.index, arrays) else 0
+    for position in range(df.shape[1]):
+        if not shares_memory(df.iloc[:, position], arrays):
+            nbytes += int(usage.iloc[position + 1])
+
+    return nbytes
+
+def estimate_nbytes(
+        value,
+        shared_ids=(),
+        arrays=(),
+):
+    """
+    Estimate the memory used by a result, excluding objects in shared_ids
+    (e.g. the shared dataset, which is not owned by the cache) and DataFrame
+    columns that are views of arrays (see shared_arrays).
+    """
+    if id(value) in shared_ids:
+        return 0
+    if isinstance(value, pd.DataFrame):
+        return dataframe_nbytes(value, arrays)
+    if isinstance(value, (dict, MappingProxyType)):
+        return sum(estimate_nbytes(item, shared_ids, arrays) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_nbytes(item, shared_ids, arrays) for item in value)
+    if hasattr(value, 'chart_kwargs'):
+        # Lazy charts hold only their arguments - see chart_generator.LazyChart
+        return estimate_nbytes(value.chart_kwargs, shared_ids, arrays)
+    if hasattr(value, 'to_plotly_json'):
+        # Plotly figures
+        return estimate_nbytes(value.to_plotly_json(), shared_ids, arrays)
+    return sys.getsizeof(value)
+
+def freeze_results(value):
+    # Read-only DataFrames and mappings, so cached results cannot be modified by callers
+    if isinstance(value, pd.DataFrame):
+        return freeze_dataframe(value)
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze_results(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze_results(item) for item in value)
+    return value
+
+def cache_evict(
+        max_entries,
+        max_bytes,
+):
+    # Drop least recently used entries until within both limits (called holding the lock)
+    total_bytes = sum(nbytes for _, nbytes in _filter_data_cache.values())
+    while _filter_data_cache and ((len(_filter_data_cache) > max_entries) or (total_bytes > max_bytes)):
+        _, (_, nbytes) = _filter_data_cache.popitem(last=False)
+        total_bytes -= nbytes
+
+def cached_result(
+        key,
+        compute_fn,
+        cache_details=None,
+        shared_values=(),
+):
+    """
+    Get a result from the cache, or compute and cache it.
+
+    Parameters:
+        key (str): The cache key - see cache_key.
+        compute_fn (callable): Called with no arguments to compute the result.
+        cache_details (dict): Cache limits - see DEFAULT_FILTER_CACHE_DETAILS.
+        shared_values (iterable): Objects not owned by the cache. They, and views of
+            their arrays, are excluded from the result's estimated size.
+
+    Returns:
+        The result, with read-only DataFrames and mappings.
+    """
+    details = details_with_defaults(DEFAULT_FILTER_CACHE_DETAILS, cache_details)
+    if not details['enabled']:
+        return compute_fn()
+
+    with _filter_data_cache_lock:
+        if key in _filter_data_cache:
+            _filter_data_cache.move_to_end(key)
+            logger.debug(f"Cache hit: {key[:12]}")
+            return _filter_data_cache[key][0]
+
+    # Not cached - calculate outside the lock
+    result = compute_fn()
+    shared_values = list(shared_values)
+    nbytes = estimate_nbytes(
+        result,
+        shared_ids={id(value) for value in shared_values},
+        arrays=shared_arrays(shared_values),
+    )
+    result = freeze_results(result)
+    logger.debug(f"Cache miss: {key[:12]} ({nbytes / (1024 * 1024):.1f} MB)")
+
+    with _filter_data_cache_lock:
+        _filter_data_cache[key] = (result, nbytes)
+        _filter_data_cache.move_to_end(key)
+        cache_evict(
+            max_entries=int(details['max_entries']),
+            max_bytes=float(details['max_megabytes']) * 1024 * 1024,
+        )
+
+    return result
+
+def clear_filter_data_cache():
+    with _filter_data_cache_lock:
+        _filter_data_cache.clear()
@@ -0,0 +1,136 @@
+import contextvars
+import functools
+import json
+import logging
+import time
+import tracemalloc
+from collections.abc import Mapping
+from contextlib import contextmanager
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Default instrumentation settings, overridden by instrumentation in config.yaml
+DEFAULT_INSTRUMENTATION_DETAILS = {
+    'enabled': True,
+    'tracemalloc': False,
+}
+
+_instrumentation_details = dict(DEFAULT_INSTRUMENTATION_DETAILS)
+
+# Spans recorded in the current rerun (None outside a rerun) and the open spans
+_rerun_spans = contextvars.ContextVar('rerun_spans', default=None)
+_open_spans = contextvars.ContextVar('open_spans', default=())
+
+def configure_instrumentation(instrumentation_details=None):
+    """
+    Set the instrumentation settings - see DEFAULT_INSTRUMENTATION_DETAILS.
+    Starts tracemalloc if its allocations are to be recorded.
+    """
+    _instrumentation_details.clear()
+    _instrumentation_details.update(DEFAULT_INSTRUMENTATION_DETAILS)
+    _instrumentation_details.update(instrumentation_details or {})
+
+    if _instrumentation_details['enabled'] and _instrumentation_details['tracemalloc'] and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def start_rerun():
+    # Collect the spans of this rerun, for rerun_spans_df
+    _rerun_spans.set([])
+
+def frame_rows(
+        value,
+        depth: int = 3,
+):
+    # Total rows of the DataFrames in value, looking into dicts, lists and tuples
+    if isinstance(value, pd.DataFrame):
+        return len(value)
+    if depth == 0:
+        return None
+    if isinstance(value, Mapping):
+        items = value.values()
+    elif isinstance(value, (list, tuple)):
+        items = value
+    else:
+        return None
+    rows = [frame_rows(item, depth - 1) for item in items]
+    rows = [row for row in rows if row is not None]
+
+    return sum(rows) if rows else None
+
+@contextmanager
+def span(
+        name,
+        rows_in=None,
+):
+    """
+    Time the enclosed code, logging the span as a JSON record.
+
+    Yields the span's dict, so 'rows_out' (and any other details) can be set
+    by the caller. Records wall and CPU time in milliseconds and, if tracemalloc
+    is enabled, the bytes allocated (net of any freed).
+    """
+    if not _instrumentation_details['enabled']:
+        yield {}
+        return
+
+    open_spans = _open_spans.get()
+    span_dict = {
+        'span': name,
+        'parent': open_spans[-1] if open_spans else None,
+        'depth': len(open_spans),
+        'rows_in': rows_in,
+        'rows_out': None,
+    }
+    token = _open_spans.set(open_spans + (name,))
+
+    # Added as the span starts, so the rerun's spans are in start order
+    rerun_spans = _rerun_spans.get()
+    if rerun_spans is not None:
+        rerun_spans.append(span_dict)
+
+    tracing = tracemalloc.is_tracing()
+    allocated_start = tracemalloc.get_traced_memory()[0] if tracing else None
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield span_dict
+    finally:
+        span_dict['wall_ms'] = (time.perf_counter() - wall_start) * 1000
+        span_dict['cpu_ms'] = (time.thread_time() - cpu_start) * 1000
+        span_dict['allocated_bytes'] = (tracemalloc.get_traced_memory()[0] - allocated_start) if tracing else None
+        _open_spans.reset(token)
+        logger.info(json.dumps(span_dict, default=str))
+
+def instrumented(fn):
+    """
+    Decorator recording a span for each call of fn, with the rows of the
+    DataFrames passed in and returned.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not _instrumentation_details['enabled']:
+            return fn(*args, **kwargs)
+        with span(fn.__name__, rows_in=frame_rows(list(args) + list(kwargs.values()))) as span_dict:
+            result = fn(*args, **kwargs)
+            span_dict['rows_out'] = frame_rows(result)
+        return result
+
+    return wrapper
+
+def rerun_spans_df():
+    """
+    The spans of the current rerun (see start_rerun), in the order they started.
+
+    Returns:
+        pd.DataFrame: A row per span, with the span name indented by its depth.
+    """
+    columns = ['span', 'wall_ms', 'cpu_ms', 'rows_in', 'rows_out', 'allocated_bytes', 'cached']
+
+    # Finished spans only (the caller's own spans are still open)
+    finished_spans = [span_dict for span_dict in (_rerun_spans.get() or []) if 'wall_ms' in span_dict]
+    spans_df = pd.DataFrame(finished_spans, columns=columns + ['depth'])
+    spans_df['span'] = ['  ' * depth + name for depth, name in zip(spans_df['depth'], spans_df['span'])]
+
+    return spans_df[columns]
@@ -0,0 +1,493 @@
+import logging
+import numpy as np
+import pandas as pd
+
+from utils import comparison_col_names
+
+logger = logging.getLogger(__name__)
+
+# Arrays along the (period, category, account) axes, calculated from the dataset
+CUBE_POSITION_KEYS = ['values', 'rank', 'market_share', 'movement', 'movement_perc']
+
+# market_totals_df columns materialised along the (period, account) axes
+CUBE_TOTALS_COLUMNS = {
+    'market_totals': 'Value',
+    'market_totals_movement': 'Movement ($)',
+    'market_totals_movement_perc': 'Movement (%)',
+}
+
+def cube_index_maps(
+        periods,
+        categories,
+        accounts,
+        date_column,
+        category_column,
+):
+    # The cube's axes, and position lookups along them
+    return {
+        'date_column': date_column,
+        'category_column': category_column,
+        'periods': periods,
+        'categories': categories,
+        'accounts': accounts,
+        'period_index': {period: position for position, period in enumerate(periods)},
+        'category_index': {category: position for position, category in enumerate(categories)},
+        'account_index': {account: position for position, account in enumerate(accounts)},
+    }
+
+def build_panel_cube(
+        df,
+        market_totals_df,
+        date_column,
+        category_column,
+        previous_cube = None,
+        affected_periods = None,
+):
+    """
+    Materialise the dataset and market aggregates into dense NumPy arrays.
+
+    Ranks and market shares are calculated within each period for all accounts at
+    once, in the dataset's wide form, and movements are from the previous month end.
+
+    With previous_cube (built from the dataset before an incremental update - see
+    data_incremental.incremental_data_loader), only the affected_periods are
+    recalculated, plus movements of the month after each, and the other periods are
+    copied from previous_cube. If the categories or accounts changed, it is built in full.
+
+    Parameters:
+        df (pd.DataFrame): The loaded dataset, a row per category per period.
+        market_totals_df (pd.DataFrame): Market totals and movements - see data_incremental.market_totals.
+        date_column (str): The period column, holding month end dates.
+        category_column (str): The institution column.
+        previous_cube (dict): The cube before the update, or None to build in full.
+        affected_periods (list): New, revised and removed periods since previous_cube.
+
+    Returns:
+        dict: The index maps ('periods', 'categories', 'accounts' and the '*_index' dicts),
+        'present' (periods x categories, True where the category reported in the period),
+        a periods x categories x accounts array for each of CUBE_POSITION_KEYS, a
+        periods x accounts array for each of CUBE_TOTALS_COLUMNS and 'sorted_positions'
+        (category positions in descending order of each account, within each period).
+        Missing values are NaN.
+    """
+    logger.debug("Executing: build_panel_cube")
+
+    periods = pd.DatetimeIndex(sorted(df[date_column].unique()))
+    categories = pd.Index(sorted(df[category_column].unique()))
+    accounts = list(pd.unique(market_totals_df['Account']))
+    cube = cube_index_maps(
+        periods=periods,
+        categories=categories,
+        accounts=accounts,
+        date_column=date_column,
+        category_column=category_column,
+    )
+
+    # Positions
+    period_positions = periods.get_indexer(df[date_column])
+    category_positions = categories.get_indexer(df[category_column])
+    shape = (len(periods), len(categories), len(accounts))
+
+    cube['present'] = np.zeros(shape[:2], dtype=bool)
+    cube['present'][period_positions, category_positions] = True
+
+    # Periods to calculate - the rest are copied from previous_cube, where it can be reused
+    month = pd.offsets.MonthEnd(1)
+    if (previous_cube is not None) and previous_cube['categories'].equals(categories) and (previous_cube['accounts'] == accounts):
+        previous_positions = previous_cube['periods'].get_indexer(periods)
+        recalculate = (previous_positions < 0) | periods.isin(affected_periods or [])
+        remeasure = recalculate | (periods - month).isin(periods[recalculate].append(pd.DatetimeIndex(affected_periods or [])))
+        logger.debug(f"Updating the panel cube for {int(recalculate.sum())} of {len(periods)} periods")
+    else:
+        if previous_cube is not None:
+            logger.debug("Categories or accounts changed, building the panel cube in full")
+        previous_positions = np.full(len(periods), -1)
+        recalculate = np.ones(len(periods), dtype=bool)
+        remeasure = recalculate
+
+    def from_previous(key, calculate):
+        # The periods not calculated, from previous_cube
+        array = np.full(shape, np.nan) if key != 'sorted_positions' else np.zeros(shape, dtype=np.intp)
+        if not calculate.all():
+            array[~calculate] = previous_cube[key][previous_positions[~calculate]]
+        return array
+
+    # Rank (highest first, ties sharing the lower rank) and market share of every
+    # account within each period, keeping the wide form
+    rows = recalculate[period_positions]
+    accounts_df = df.loc[rows, accounts].astype(float)
+    period_groups = accounts_df.groupby(df.loc[rows, date_column].to_numpy(), sort=False)
+    wide_dfs = {
+        'values': accounts_df,
+        'rank': period_groups.rank(method='max', ascending=False),
+        'market_share': accounts_df / period_groups.transform('sum'),
+    }
+    for key, wide_df in wide_dfs.items():
+        cube[key] = from_previous(key, recalculate)
+        cube[key][period_positions[rows], category_positions[rows]] = wide_df.to_numpy()
+    del wide_dfs, period_groups, accounts_df
+
+    # Movements from the previous month end, where it is in the data
+    movement_periods = np.flatnonzero(remeasure)
+    previous_month_positions = periods.get_indexer(periods[movement_periods] - month)
+    has_previous = previous_month_positions >= 0
+    previous_values = np.full((len(movement_periods),) + shape[1:], np.nan)
+    previous_values[has_previous] = cube['values'][previous_month_positions[has_previous]]
+    cube['movement'] = from_previous('movement', remeasure)
+    cube['movement_perc'] = from_previous('movement_perc', remeasure)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cube['movement'][movement_periods] = cube['values'][movement_periods] - previous_values
+        cube['movement_perc'][movement_periods] = cube['movement'][movement_periods] / previous_values
+    del previous_values
+
+    # Categories in descending order of each account within each period, NaN values last
+    cube['sorted_positions'] = from_previous('sorted_positions', recalculate)
+    recalculate_values = cube['values'][recalculate]
+    sort_values = np.where(np.isnan(recalculate_values), -np.inf, recalculate_values)
+    cube['sorted_positions'][recalculate] = np.argsort(-sort_values, axis=1, kind='stable')
+    del sort_values, recalculate_values
+
+    # Totals
+    period_positions = periods.get_indexer(market_totals_df[date_column])
+    account_positions = pd.Index(accounts).get_indexer(market_totals_df['Account'])
+    for key, column in CUBE_TOTALS_COLUMNS.items():
+        cube[key] = np.full((len(periods), len(accounts)), np.nan)
+        cube[key][period_positions, account_positions] = market_totals_df[column].to_numpy()
+
+    # Shared between sessions, so ensure the arrays are not modified
+    for value in cube.values():
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+
+    logger.debug("Executed: build_panel_cube")
+    return cube
+
+def panel_cube_arrays(cube):
+    """
+    The cube as a flat dict of NumPy arrays, e.g. to save with np.savez - see panel_cube_from_arrays.
+    """
+    arrays = {key: value for key, value in cube.items() if isinstance(value, np.ndarray)}
+    arrays['periods'] = cube['periods'].to_numpy()
+    arrays['categories'] = np.array(cube['categories'], dtype=str)
+    arrays['accounts'] = np.array(cube['accounts'], dtype=str)
+    arrays['columns'] = np.array([cube['date_column'], cube['category_column']], dtype=str)
+    return arrays
+
+def panel_cube_from_arrays(arrays):
+    """
+    The cube saved by panel_cube_arrays, with read-only arrays.
+    """
+    date_column, category_column = arrays['columns'].tolist()
+    cube = cube_index_maps(
+        periods=pd.DatetimeIndex(arrays['periods']),
+        categories=pd.Index(arrays['categories'].tolist()),
+        accounts=arrays['accounts'].tolist(),
+        date_column=date_column,
+        category_column=category_column,
+    )
+    for key, value in arrays.items():
+        if key not in ['periods', 'categories', 'accounts', 'columns']:
+            value.flags.writeable = False
+            cube[key] = value
+
+    return cube
+
+def cube_period_slice(
+        cube,
+        selected_date,
+):
+    # Periods up to and including the selected date
+    return slice(0, cube['periods'].searchsorted(pd.Timestamp(selected_date), side='right'))
+
+def cube_market_positions(
+        cube,
+        selected_column,
+        selected_date,
+):
+    """
+    Market positions up to the selected date, as data_filtering.market_positions
+    returns them, by slicing the cube. Rank is NaN where the category reported
+    no value for the selected column.
+    """
+    date_column = cube['date_column']
+    category_column = cube['category_column']
+    account_position = cube['account_index'][selected_column]
+    period_slice = cube_period_slice(cube, selected_date)
+
+    # Reporting (period, category) pairs
+    period_positions, category_positions = np.nonzero(cube['present'][period_slice])
+    values = cube['values'][period_slice, :, account_position][period_positions, category_positions]
+
+    # Order by date, then by the selected column within each date
+    order = np.lexsort((-values, period_positions))
+    period_positions = period_positions[order]
+    category_positions = category_positions[order]
+
+    return pd.DataFrame({
+        date_column: cube['periods'][period_positions],
+        category_column: cube['categories'][category_positions],
+        selected_column: values[order],
+        'Rank': cube['rank'][period_positions, category_positions, account_position],
+        'Market Share': cube['market_share'][period_positions, category_positions, account_position],
+    })
+
+def cube_timeline_positions(
+        cube,
+        selected_column,
+        top_x_value,
+        selected_category = None,
+):
+    """
+    The top x categories of every period by the selected column (and the selected
+    category, where it reported a value), with their ranks and market shares - the
+    data of chart_generator.timeline_chart. Categories without a value are not shown.
+
+    Returns:
+        pd.DataFrame: cube_market_positions rows over all periods, by date then rank.
+    """
+    positions_df = cube_market_positions(
+        cube=cube,
+        selected_column=selected_column,
+        selected_date=cube['periods'][-1],
+    )
+    ranks = positions_df['Rank']
+    shown = ranks.notna() & (ranks <= top_x_value)
+    if selected_category is not None:
+        shown |= positions_df[cube['category_column']] == selected_category
+
+    # Reported, but without a value for the selected column
+    shown &= positions_df[selected_column].notna()
+
+    return positions_df[shown].reset_index(drop=True)
+
+def cube_two_date_comparison(
+        cube,
+        selected_column,
+        current_date,
+        comparison_date,
+):
+    """
+    Compare every institution between any two periods, from the cube.
+
+    Parameters:
+        cube (dict): See build_panel_cube.
+        selected_column (str): The account to compare.
+        current_date (datetime): The later period.
+        comparison_date (datetime): The period to compare with.
+
+    Returns:
+        dict: As data_filtering.date_to_date_comparison returns, for all institutions
+        reporting at either date, plus 'market_share_movement_col_name' (the change
+        in market share) and 'rank_movement_col_name' (current less comparison rank,
+        so negative is a move up the rankings).
+    """
+    category_column = cube['category_column']
+    account_position = cube['account_index'][selected_column]
+    current_position = cube['period_index'][pd.Timestamp(current_date)]
+    comparison_position = cube['period_index'][pd.Timestamp(comparison_date)]
+    positions = [comparison_position, current_position]
+
+    # Institutions reporting at either date
+    categories_mask = cube['present'][positions].any(axis=0)
+    values = cube['values'][positions][:, categories_mask, account_position]
+    market_share = cube['market_share'][positions][:, categories_mask, account_position]
+    rank = cube['rank'][positions][:, categories_mask, account_position]
+
+    col_names = comparison_col_names(selected_column, 'Comparison')
+    col_names['market_share_movement_col_name'] = f"{selected_column} - Comparison Market Share Movement"
+    col_names['rank_movement_col_name'] = f"{selected_column} - Comparison Rank Movement"
+
+    dollar_movements = values[1] - values[0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percentage_movements = dollar_movements / values[0]
+        percentage_of_market_movements = dollar_movements / cube['market_totals'][comparison_position, account_position]
+
+    comparison_df = pd.DataFrame({
+        category_column: cube['categories'][categories_mask],
+        'comparison': values[0],
+        'current': values[1],
+        col_names['dollar_movements_col_name']: dollar_movements,
+        col_names['movements_direction_col_name']: np.where(dollar_movements >= 0, 'increase', 'decrease'),
+        col_names['percentage_movements_col_name']: percentage_movements,
+        col_names['percentage_of_market_movements_col_name']: percentage_of_market_movements,
+        'Comparison Market Share': market_share[0],
+        'Current Market Share': market_share[1],
+        col_names['market_share_movement_col_name']: market_share[1] - market_share[0],
+        'Comparison Rank': rank[0],
+        'Current Rank': rank[1],
+        col_names['rank_movement_col_name']: rank[1] - rank[0],
+    })
+
+    return {
+        'prefix': 'Comparison',
+        'df': comparison_df,
+        **col_names,
+        'selected_date': current_date,
+        'comparison_date': comparison_date,
+    }
+
+def cube_ranked_categories(
+        cube,
+        selected_column,
+        selected_date,
+):
+    """
+    The categories reporting at the selected date, largest first by the selected
+    column, from the presorted cube (no sorting per call).
+
+    Returns:
+        list: The categories in rank order.
+    """
+    period_position = cube['period_index'][pd.Timestamp(selected_date)]
+    account_position = cube['account_index'][selected_column]
+
+    # Presorted categories, keeping only those reporting at the date
+    sorted_positions = cube['sorted_positions'][period_position, :, account_position]
+    sorted_positions = sorted_positions[cube['present'][period_position, sorted_positions]]
+
+    return cube['categories'][sorted_positions].tolist()
+
+def cube_ranked_prefix_sums(
+        cube,
+        selected_column,
+        selected_date,
+):
+    """
+    The selected column's values up to the selected date, with the categories in
+    their order at the selected date, and the cumulative sums across that order.
+
+    The sum over any top n categories is then a single column of
+    'cumulative_values', and 'other' is the last column less that sum.
+
+    Returns:
+        dict: 'periods', 'order' (category positions in ranked order), 'place' (each category
+        position's place in the order), 'values' and 'present' (periods x ranked categories,
+        NaN values as 0) and 'cumulative_values' (periods x ranked categories + 1, starting at 0).
+    """
+    period_slice = cube_period_slice(cube, selected_date)
+    account_position = cube['account_index'][selected_column]
+    order = cube['sorted_positions'][period_slice.stop - 1, :, account_position]
+
+    place = np.empty_like(order)
+    place[order] = np.arange(len(order))
+
+    values = np.nan_to_num(cube['values'][period_slice, :, account_position][:, order])
+    cumulative_values = np.zeros((values.shape[0], values.shape[1] + 1))
+    np.cumsum(values, axis=1, out=cumulative_values[:, 1:])
+
+    ranked_prefix_dict = {
+        'periods': cube['periods'][period_slice],
+        'order': order,
+        'place': place,
+        'values': values,
+        'present': cube['present'][period_slice][:, order],
+        'cumulative_values': cumulative_values,
+    }
+    for value in ranked_prefix_dict.values():
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+
+    return ranked_prefix_dict
+
+def previous_row_values(
+        values,
+        present,
+):
+    # Each column's value at the previous period it is present in (NaN if none), as a
+    # grouped shift over the present rows would give
+    row_positions = np.where(present, np.arange(len(values))[:, np.newaxis], -1)
+    previous_positions = np.maximum.accumulate(
+        np.vstack([np.full((1, values.shape[1]), -1), row_positions[:-1]]), axis=0
+    )
+    previous_values = np.take_along_axis(values, np.maximum(previous_positions, 0), axis=0)
+
+    return np.where(previous_positions >= 0, previous_values, np.nan)
+
+def cube_top_x_and_other(
+        cube,
+        ranked_prefix_dict,
+        selected_column,
+        top_x_category_list,
+        other_col = 'other',
+):
+    """
+    Top x and 'other' data from the cube, as the df dict data_filtering.create_top_x_and_other_df
+    returns, without grouping the dated data.
+
+    Parameters:
+        cube (dict): See build_panel_cube.
+        ranked_prefix_dict (dict): See cube_ranked_prefix_sums, for the selected column and date.
+        selected_column (str): The account.
+        top_x_category_list (list): The top categories.
+        other_col (str): Name of the 'other' category.
+
+    Returns:
+        dict: 'df' (rows by date then category) and its column names.
+    """
+    date_column = cube['date_column']
+    category_column = cube['category_column']
+    periods = ranked_prefix_dict['periods']
+    values = ranked_prefix_dict['values']
+
+    # Top categories in name order, by their place in the ranked order (unknown categories are 0)
+    top_categories = sorted(top_x_category_list)
+    category_positions = cube['categories'].get_indexer(top_categories)
+    places = np.where(category_positions >= 0, ranked_prefix_dict['place'][category_positions], -1)
+    top_values = np.where(places >= 0, values[:, np.maximum(places, 0)], 0.0)
+
+    # Top sum - the prefix sum over the leading places, plus any categories placed after them
+    top_places = np.sort(places[places >= 0])
+    leading = int(np.cumprod(top_places == np.arange(len(top_places))).sum())
+    top_sums = ranked_prefix_dict['cumulative_values'][:, leading] + values[:, top_places[leading:]].sum(axis=1)
+
+    # 'other' - everything else, for periods with other categories reporting
+    other_values = ranked_prefix_dict['cumulative_values'][:, -1] - top_sums
+    in_top = np.zeros(values.shape[1], dtype=bool)
+    in_top[top_places] = True
+    other_present = (ranked_prefix_dict['present'] & ~in_top).any(axis=1)
+
+    # Periods x categories, in name order with 'other' placed as a sorted name
+    all_categories = sorted(top_categories + [other_col])
+    other_position = all_categories.index(other_col)
+    category_values = np.insert(top_values, other_position, other_values, axis=1)
+    category_present = np.ones(category_values.shape, dtype=bool)
+    category_present[:, other_position] = other_present
+
+    # MoM movements over each category's reporting periods
+    previous_values = previous_row_values(category_values, category_present)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dollar_movements = category_values - previous_values
+        percentage_movements = (category_values / previous_values) - 1
+
+    # Rank and market share - 'other' is ranked last with the residual market share
+    account_position = cube['account_index'][selected_column]
+    period_slice = slice(0, len(periods))
+    top_present = np.where(category_positions >= 0, cube['present'][period_slice][:, np.maximum(category_positions, 0)], False)
+    ranks = np.where(top_present, cube['rank'][period_slice, np.maximum(category_positions, 0), account_position], np.nan)
+    market_share = np.where(top_present, cube['market_share'][period_slice, np.maximum(category_positions, 0), account_position], np.nan)
+    other_ranks = np.full(len(periods), len(top_categories) + 1.0)
+    other_market_share = 1 - np.nansum(market_share, axis=1)
+    ranks = np.insert(ranks, other_position, other_ranks, axis=1)
+    market_share = np.insert(market_share, other_position, other_market_share, axis=1)
+
+    # Rows by date, then category
+    period_rows, category_rows = np.nonzero(category_present)
+    dollar_movements_col = f'{selected_column} - MoM Movement ($)'
+    percentage_movements_col = f'{selected_column} - MoM Movement (%)'
+    top_x_and_other_df = pd.DataFrame({
+        date_column: periods[period_rows],
+        category_column: np.array(all_categories, dtype=object)[category_rows],
+        selected_column: category_values[period_rows, category_rows],
+        dollar_movements_col: dollar_movements[period_rows, category_rows],
+        percentage_movements_col: percentage_movements[period_rows, category_rows],
+        'Rank': ranks[period_rows, category_rows],
+        'Market Share': market_share[period_rows, category_rows],
+    })
+
+    return {
+        'df': top_x_and_other_df,
+        'category_col': category_column,
+        'dollar_col': selected_column,
+        'dollar_movements_col': dollar_movements_col,
+        'percentage_movements_col': percentage_movements_col,
+    }
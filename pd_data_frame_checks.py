@@ -1,5 +1,7 @@
 import pandas as pd
 
+from instrumentation import instrumented
+
 def check_columns_existence(df, target_columns):
     """
     Check if all specified columns exist in a DataFrame.
@@ -46,6 +48,7 @@ def convert_columns_by_type(df, cols_list, cols_type):
     
     return df
 
+@instrumented
 def convert_columns_dict_type_allocation(df, col_types_dict):
     """
     Convert specified columns in a DataFrame to their respective data types based on a dictionary.
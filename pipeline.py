@@ -0,0 +1,288 @@
+import logging
+from types import MappingProxyType
+
+from filter_cache import cache_key, cached_result
+from instrumentation import instrumented, span
+from data_filtering import filter_dates, filter_market_positions, filter_aggregates, filter_top_x
+from panel_cube import cube_ranked_prefix_sums, cube_timeline_positions
+from chart_generator import generate_charts, TimelineChart
+from utils_dataframe_calcs import freeze_dataframe
+from descriptions import generate_descriptions
+
+logger = logging.getLogger(__name__)
+
+def stage_inputs(
+        stages,
+        stage_name,
+):
+    """
+    Get all inputs a stage depends on - its declared inputs and those of the
+    stages it requires.
+    """
+    inputs = set(stages[stage_name]['inputs'])
+    for required_stage in stages[stage_name]['requires']:
+        inputs |= stage_inputs(stages, required_stage)
+
+    return inputs
+
+def run_pipeline(
+        stages,
+        context,
+        data_version,
+        cache_details=None,
+):
+    """
+    Run each stage, reusing its cached output unless one of its inputs changed.
+
+    Parameters:
+        stages (dict): Stage name to a dict of 'fn', 'inputs' and 'requires', in run order.
+            'fn' is called with the read-only context, 'inputs' are the context values
+            it depends on and 'requires' are the earlier stages whose output it uses.
+        context (dict): The shared data, constants and selections.
+        data_version (str): Version of the shared data - see data_store.shared_data_version.
+        cache_details (dict): Cache limits - see filter_cache.DEFAULT_FILTER_CACHE_DETAILS.
+
+    Returns:
+        dict: The context, plus the read-only output of each stage under the stage name.
+    """
+    shared_values = list(context.values())
+    context = dict(context)
+
+    for stage_name, stage in stages.items():
+        for required_stage in stage['requires']:
+            if required_stage not in context:
+                raise ValueError(f"Error: stage '{stage_name}' requires '{required_stage}', which has not run")
+
+        # Only the inputs the stage depends on identify its output
+        key = cache_key([
+            'pipeline',
+            stage_name,
+            str(data_version),
+            [[name, context[name]] for name in sorted(stage_inputs(stages, stage_name))],
+        ])
+        with span(f'stage: {stage_name}') as stage_span:
+            def compute_stage():
+                stage_span['cached'] = False
+                return stage['fn'](MappingProxyType(context))
+
+            stage_span['cached'] = True
+            context[stage_name] = cached_result(
+                key=key,
+                compute_fn=compute_stage,
+                cache_details=cache_details,
+                shared_values=shared_values,
+            )
+
+    return context
+
+def dates_stage(context):
+    return filter_dates(
+        df=context['df'],
+        date_column=context['date_column'],
+        selected_date=context['selected_date'],
+        dates_sorted=context['dates_sorted'],
+    )
+
+def market_positions_stage(context):
+    return filter_market_positions(
+        dated_df=context['dates'][0]['dated_df'],
+        date_column=context['date_column'],
+        selected_date=context['selected_date'],
+        selected_column=context['selected_column'],
+        category_column=context['category_column'],
+        panel_cube=context['panel_cube'],
+    )
+
+def aggregates_stage(context):
+    return filter_aggregates(
+        dated_df=context['dates'][0]['dated_df'],
+        date_column=context['date_column'],
+        selected_date=context['selected_date'],
+        category_column=context['category_column'],
+        market_totals_df=context['market_totals_df'],
+    )
+
+def top_x_prefix_stage(context):
+    # Institutions ranked at the selected date with cumulative sums, shared by every top x
+    if context['panel_cube'] is None:
+        return None
+    return cube_ranked_prefix_sums(
+        cube=context['panel_cube'],
+        selected_column=context['selected_column'],
+        selected_date=context['selected_date'],
+    )
+
+def top_x_stage(context):
+    return filter_top_x(
+        dated_df=context['dates'][0]['dated_df'],
+        market_position_df=context['market_positions'],
+        date_details=context['dates'][1],
+        date_column=context['date_column'],
+        selected_date=context['selected_date'],
+        selected_column=context['selected_column'],
+        category_column=context['category_column'],
+        top_x_category_list=context['top_x_category_list'],
+        panel_cube=context['panel_cube'],
+        ranked_prefix_dict=context['top_x_prefix'],
+    )
+
+def pipeline_dicts(context):
+    """
+    Combine the outputs of the filtering stages that have run into the
+    dfs_dict and details_dicts returned by data_filtering.filter_data.
+    """
+    dfs_dict = {}
+    details_dicts = {}
+    if 'dates' in context:
+        dfs_dict.update(context['dates'][0])
+        details_dicts.update(context['dates'][1])
+    if 'market_positions' in context:
+        dfs_dict['market_position_df'] = context['market_positions']
+    if 'aggregates' in context:
+        dfs_dict['aggregates_df_dict'] = context['aggregates']
+    if 'top_x' in context:
+        dfs_dict.update(context['top_x'][0])
+        details_dicts.update(context['top_x'][1])
+
+    return dfs_dict, details_dicts
+
+def charts_stage(context):
+    dfs_dict, details_dicts = pipeline_dicts(context)
+    return generate_charts(
+        dfs_dict=dfs_dict,
+        details_dicts=details_dicts,
+        date_column=context['date_column'],
+        selected_date=context['selected_date'],
+        category_column=context['category_column'],
+        selected_category=None,
+        selected_column=context['selected_column'],
+        top_x_category_list=context['top_x_category_list'],
+        color_discrete_map=context['color_discrete_map'],
+    )
+
+def timeline_stage(context):
+    # All periods of the selected column, for scrubbing through in the browser
+    if context['panel_cube'] is None:
+        return None
+    return TimelineChart(
+        df=freeze_dataframe(cube_timeline_positions(
+            cube=context['panel_cube'],
+            selected_column=context['selected_column'],
+            top_x_value=context['top_x_value'],
+            selected_category=context['selected_category'],
+        )),
+        date_column=context['date_column'],
+        category_column=context['category_column'],
+        selected_column=context['selected_column'],
+        color_discrete_map=context['color_discrete_map'],
+    )
+
+def descriptions_stage(context):
+    dfs_dict, details_dicts = pipeline_dicts(context)
+    return generate_descriptions(
+        dfs_dict=dfs_dict,
+        date_column=context['date_column'],
+        selected_column=context['selected_column'],
+        category_column=context['category_column'],
+        selected_category=context['selected_category'],
+        aliases_dict=context['aliases_dict'],
+        details_dicts=details_dicts,
+    )
+
+# Dashboard stages, in run order. Changing the selected category only reruns the
+# descriptions, and changing the top x only reruns the top x, charts and descriptions -
+# the top x ranking and cumulative sums are reused, so no grouping is needed. The
+# timeline covers all periods, so is not rerun when the selected date changes.
+DASHBOARD_STAGES = {
+    'dates': {
+        'fn': dates_stage,
+        'inputs': ['selected_date'],
+        'requires': [],
+    },
+    'market_positions': {
+        'fn': market_positions_stage,
+        'inputs': ['selected_date', 'selected_column'],
+        'requires': ['dates'],
+    },
+    'aggregates': {
+        'fn': aggregates_stage,
+        'inputs': ['selected_date'],
+        'requires': ['dates'],
+    },
+    'top_x_prefix': {
+        'fn': top_x_prefix_stage,
+        'inputs': ['selected_date', 'selected_column'],
+        'requires': ['dates'],
+    },
+    'top_x': {
+        'fn': top_x_stage,
+        'inputs': ['selected_column', 'top_x_category_list'],
+        'requires': ['dates', 'market_positions', 'top_x_prefix'],
+    },
+    'charts': {
+        'fn': charts_stage,
+        'inputs': [],
+        'requires': ['dates', 'top_x'],
+    },
+    'timeline': {
+        'fn': timeline_stage,
+        'inputs': ['selected_column', 'top_x_value', 'selected_category'],
+        'requires': [],
+    },
+    'descriptions': {
+        'fn': descriptions_stage,
+        'inputs': ['selected_category'],
+        'requires': ['dates', 'aggregates', 'top_x'],
+    },
+}
+
+@instrumented
+def run_dashboard_pipeline(
+        shared_data,
+        date_column,
+        category_column,
+        selected_date,
+        selected_column,
+        selected_category,
+        top_x_category_list,
+        top_x_value = 15,
+):
+    """
+    Run the dashboard stages for the selections.
+
+    Parameters:
+        shared_data (Mapping): See data_store.get_shared_data.
+        date_column (str): The period column.
+        category_column (str): The institution column.
+        selected_date, selected_column, selected_category, top_x_category_list, top_x_value:
+            The selections - see data_select_filters.select_data_filters.
+
+    Returns:
+        tuple: Read-only dfs_dict, details_dicts, charts_dict and descriptions_dict.
+        charts_dict includes the TimelineChart under 'timeline' (None without a panel cube).
+    """
+    context = run_pipeline(
+        stages=DASHBOARD_STAGES,
+        context={
+            'df': shared_data['df'],
+            'dates_sorted': shared_data['dates_sorted'],
+            'market_totals_df': shared_data['market_totals_df'],
+            'panel_cube': shared_data['panel_cube'],
+            'aliases_dict': shared_data['aliases_dict'],
+            'color_discrete_map': shared_data['color_discrete_map'],
+            'date_column': date_column,
+            'category_column': category_column,
+            'selected_date': selected_date,
+            'selected_column': selected_column,
+            'selected_category': selected_category,
+            'top_x_category_list': list(top_x_category_list),
+            'top_x_value': top_x_value,
+        },
+        data_version=shared_data['data_version'],
+        cache_details=shared_data['filter_cache_details'],
+    )
+    dfs_dict, details_dicts = pipeline_dicts(context)
+
+    charts_dict = MappingProxyType({**context['charts'], 'timeline': context['timeline']})
+
+    return dfs_dict, details_dicts, charts_dict, context['descriptions']
@@ -2,6 +2,8 @@ import logging
 import numpy as np
 import pandas as pd
 
+from utils_dataframe_calcs import grouped_movements
+
 # Create a logger variable
 logger = logging.getLogger(__name__)
 
@@ -42,32 +44,6 @@ def apply_current_ranking(
     
     return df
 
-def movement_fn(
-        df,
-        unique_id_col,
-        movement_column,
-):
-    for abn in df[unique_id_col].unique():
-        # Create mask for the unique id
-        unique_id_mask = df[unique_id_col] == abn
-
-        # Get dollar movements
-        mom_dollar_col = movement_column + ' - MoM ($)'
-        df.loc[unique_id_mask, mom_dollar_col] = df.loc[unique_id_mask, movement_column].diff()
-        # Set NaN for the first row since there's no previous month
-        df.loc[unique_id_mask & df.index.isin([df.loc[unique_id_mask].index[0]]), mom_dollar_col] = None
-
-        # Get percentage movements
-        mom_percentage_col = movement_column + ' - MoM (%)'
-        df.loc[unique_id_mask, mom_percentage_col] = (df.loc[unique_id_mask, mom_dollar_col] / df.loc[unique_id_mask, movement_column].shift(1))
-         
-        # Get direction of movement
-        movement_direction = np.where(df.loc[unique_id_mask, mom_dollar_col] < 0, 'decrease', np.where(df.loc[unique_id_mask, mom_dollar_col] > 0, 'increase', 'none'))
-        mom_direction_col = movement_column + ' - MoM Movement Direction'
-        df.loc[unique_id_mask, mom_direction_col] = movement_direction
-
-    return df
-
 def single_column_stats_fn(
         df,
         date_column,
@@ -95,10 +71,10 @@ def single_column_stats_fn(
         group_concatenated = 'group_concatenated',
     )
 
-    df=movement_fn(
+    df=grouped_movements(
         df=df,
-        unique_id_col='ABN',
-        movement_column=selected_column,
+        group_column='ABN',
+        movement_columns=[selected_column],
     )
 
     # drop the group_concatenated column
@@ -4,42 +4,42 @@ import logging
 
 from utils import read_yaml
 from utils_logging import setup_logging
-from utils_logging import close_log_handlers
-from data_loading import data_loader
-from data_filtering import filter_data
+from instrumentation import configure_instrumentation, start_rerun, rerun_spans_df
+from data_store import get_shared_data
+from pipeline import run_dashboard_pipeline
 from tabs.tab_column_summary import tab_column_summary_content
 from tabs.aggregate_summary import tab_aggregate_content
 from tabs.tab_account_stats import tab_account_stats
 from tabs.tab_about_page import tab_about
+from tabs.tab_date_comparison import tab_date_comparison
 from data_select_filters import select_data_filters
-from chart_generator import generate_charts
-from descriptions import generate_descriptions
 
-# Setup logging
-close_log_handlers()
-setup_logging()
+# Setup logging - once per process, log files are written by a background thread
+setup_logging(logging_details=read_yaml(file_path='config.yaml').get('logging', {}))
+
+# Time this rerun's stages - summarised in the About tab
+configure_instrumentation(read_yaml(file_path='config.yaml').get('instrumentation', {}))
+start_rerun()
+
 logger = logging.getLogger(__name__)
 logger.info("This is an info message from main.")
 
 # Set page width
 st.set_page_config(layout="wide")
 
-# Get aliases from yaml
-aliases_dict = read_yaml(file_path = 'aliases.yaml')
-
-# Set colour scheme
-color_discrete_map = read_yaml(file_path = 'color_discrete_map.yaml')
-
-# Get data
-df, file_name = data_loader()
-
 # Grouping Columns
 date_column = 'Period'
 category_column = 'Institution Name'
 exclude_columns = ['ABN']
-df = df.drop(columns=exclude_columns)
 group_by_columns = [date_column] + [category_column]
 
+# Get data, aliases and colour scheme - loaded once and shared by all sessions
+shared_data = get_shared_data(exclude_columns=exclude_columns)
+df = shared_data['df']
+file_name = shared_data['file_name']
+aliases_dict = shared_data['aliases_dict']
+color_discrete_map = shared_data['color_discrete_map']
+
 # Set default selections
 default_category = 'Macquarie Bank Limited'
 default_column = 'Business Loans'
@@ -70,46 +70,29 @@ st.write("Please make your filtering selections below:")
     default_column=default_column,
     category_column=category_column,
     default_category=default_category,
+    panel_cube=shared_data['panel_cube'],
+    dates_sorted=shared_data['dates_sorted'],
 )
 
-# Filter data
-dfs_dict, details_dicts = filter_data(
-        df = df,
-        date_column = date_column,
-        selected_date = selected_date,
-        group_by_columns=group_by_columns,
-        selected_column = selected_column,
-        category_column = category_column,
-        selected_category = selected_category,
-        top_x_category_list = top_x_category_list,
-)
-
-# Generate graphs
-charts_dict = generate_charts(
-    dfs_dict = dfs_dict,
-    details_dicts = details_dicts,
+# Filter data, generate graphs and descriptions - each stage is only rerun when its inputs change
+(
+    dfs_dict,
+    details_dicts,
+    charts_dict,
+    descriptions_dict,
+) = run_dashboard_pipeline(
+    shared_data = shared_data,
     date_column = date_column,
-    selected_date = selected_date,
     category_column = category_column,
-    selected_category = selected_category,
-    selected_column = selected_column,
-    top_x_category_list = top_x_category_list,
-    color_discrete_map = color_discrete_map,
-)
-
-# Generate Descriptions
-descriptions_dict = generate_descriptions(
-    dfs_dict = dfs_dict,
-    date_column = date_column,
+    selected_date = selected_date,
     selected_column = selected_column,
-    category_column = category_column,
     selected_category = selected_category,
-    aliases_dict = aliases_dict,
-    details_dicts = details_dicts,
+    top_x_category_list = top_x_category_list,
+    top_x_value = top_x_value,
 )
 
 # Insert containers separated into tabs:
-tab1, tab3 = st.tabs(["Account Statistics", "About"])
+tab1, tab_comparison, tab3 = st.tabs(["Account Statistics", "Date Comparison", "About"])
 # tab1, tab2, tab3 = st.tabs(["Account Statistics", "Market Summaries", "About"])
 
 # Tab 1 content
@@ -122,6 +105,19 @@ with tab1:
         descriptions_dict = descriptions_dict,
         aliases_dict = aliases_dict,
         details_dicts = details_dicts,
+        data_version = shared_data['data_version'],
+        figure_cache_details = shared_data['figure_cache_details'],
+        chart_pool_details = shared_data['chart_pool_details'],
+    )
+
+# Date comparison content
+with tab_comparison:
+    tab_date_comparison(
+        panel_cube = shared_data['panel_cube'],
+        selected_column = selected_column,
+        selected_category = selected_category,
+        aliases_dict = aliases_dict,
+        color_discrete_map = color_discrete_map,
     )
 
 # Tab 2 content
@@ -134,10 +130,10 @@ with tab1:
      
 ## 
 # Tab 3 content
-close_log_handlers()
 with tab3:
     tab_about(
         dfs_dict,
         file_name,
+        spans_df = rerun_spans_df(),
     )
 
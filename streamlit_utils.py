@@ -4,6 +4,8 @@ import plotly.express as px
 import plotly as pt
 import altair as alt
 
+from utils_dataframe_calcs import as_at_date
+
 
 def graph_selected_col(
         df,
@@ -95,7 +97,7 @@ def streamlit_column_graph(
     if selected_date is None:
         selected_date = df[date_column].max()
 
-    chart_data_df = df[df[date_column] == selected_date][[category_column, selected_column]]
+    chart_data_df = as_at_date(df, date_column, selected_date)[[category_column, selected_column]]
 
     # Sort the DataFrame by the desired column
     sorted_chart_data_df = chart_data_df.sort_values(by=selected_column, ascending=False).reset_index(drop=True).copy()
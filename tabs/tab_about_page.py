@@ -2,9 +2,12 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import io
+import logging
 
 import streamlit as st
 
+from utils_logging import log_records_text
+
 def get_file_content_as_string(path):
     """Read a file and return its content as a string."""
     with open(path, "rb") as file:
@@ -32,6 +35,7 @@ def download_file(
 def tab_about(
         dfs_dict,
         file_name,
+        spans_df = None,
 ):
     st.title("About the APRA Monthly ADI Statistics Dashboard")
 
@@ -87,6 +91,23 @@ def tab_about(
     
 
 
+    # Timings of this rerun - see instrumentation.span
+    if spans_df is not None:
+        st.markdown("# Performance:")
+        st.write("Time taken by each stage of this rerun (cached stages were not recalculated):")
+        st.dataframe(
+            spans_df,
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                'wall_ms': st.column_config.NumberColumn('Wall (ms)', format='%.1f'),
+                'cpu_ms': st.column_config.NumberColumn('CPU (ms)', format='%.1f'),
+                'rows_in': st.column_config.NumberColumn('Rows in'),
+                'rows_out': st.column_config.NumberColumn('Rows out'),
+                'allocated_bytes': st.column_config.NumberColumn('Allocated (bytes)'),
+            },
+        )
+
     # Key Points information
     st.markdown("# Downloads:")
 
@@ -97,17 +118,19 @@ def tab_about(
         mime = "text/plain",
     )
 
-    # INFO Logs
-    download_file(
-        file_path = "logs/info.log",
+    # INFO Logs - the recent records kept in memory
+    st.download_button(
         label = 'Download INFO logs',
+        data = log_records_text(level=logging.INFO),
+        file_name = 'info.log',
         mime = "text/plain",
     )
 
     # Details Logs
-    download_file(
-        file_path = "logs/detailed.log",
+    st.download_button(
         label = 'Download DEBUG logs',
+        data = log_records_text(level=logging.DEBUG),
+        file_name = 'detailed.log',
         mime = "text/plain",
     )
 
@@ -1,10 +1,15 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
+from functools import partial
 
 from utils import rounded_dollars_md
 from streamlit_utils import graph_selected_col
+from figure_cache import cached_figure
+from chart_generator import build_figures
+from instrumentation import instrumented
 
+@instrumented
 def tab_account_stats(
         dfs_dict,
         charts_dict,
@@ -13,6 +18,9 @@ def tab_account_stats(
         descriptions_dict,
         aliases_dict,
         details_dicts,
+        data_version = None,
+        figure_cache_details = None,
+        chart_pool_details = None,
 ):
     # Tab header
     st.markdown(f"# {selected_column} as at {selected_date.strftime('%d %B %Y')}")
@@ -25,15 +33,47 @@ def tab_account_stats(
     # Provide Plot
     st.markdown("## Balance Charts")
     st.write(descriptions_dict['balance_movements_graph_text'])
-    st.plotly_chart(charts_dict[selected_column], use_container_width=True)
+    balance_chart = st.empty()
 
-    # Movement Charts
+    # Movement Charts - only the selected horizons' charts are built
     st.markdown("## Movement Charts")
-    for months_ago in details_dicts['months_ago_list']:
-        title = details_dicts[f'date_{months_ago}_col_prefix']
-        if title in dfs_dict.keys():
-            st.write(f"### {title} Movments")
-            st.plotly_chart(charts_dict[f'{selected_column} - {title} Movement ($)'], use_container_width=True)
-            st.plotly_chart(charts_dict[f'{selected_column} - {title} Movement (%)'], use_container_width=True)
+    titles = [
+        details_dicts[f'date_{months_ago}_col_prefix']
+        for months_ago in details_dicts['months_ago_list']
+        if details_dicts[f'date_{months_ago}_col_prefix'] in dfs_dict.keys()
+    ]
+    selected_titles = st.multiselect(
+        'Show movements over',
+        titles,
+        default=titles[0:1],
+        key='account_stats_movement_horizons',
+    )
+    shown_titles = [title for title in titles if title in selected_titles]
+
+    # The charts shown are built together, loaded from the figure cache or built and cached
+    chart_names = [selected_column]
+    for title in shown_titles:
+        chart_names += [f'{selected_column} - {title} Movement ($)', f'{selected_column} - {title} Movement (%)']
+    figures = build_figures(
+        charts={chart_name: charts_dict[chart_name] for chart_name in chart_names},
+        figure_fn=partial(cached_figure, data_version=data_version, cache_details=dict(figure_cache_details or {})),
+        pool_details=chart_pool_details,
+    )
+
+    balance_chart.plotly_chart(figures[selected_column], use_container_width=True)
+    for title in shown_titles:
+        st.write(f"### {title} Movments")
+        st.plotly_chart(figures[f'{selected_column} - {title} Movement ($)'], use_container_width=True)
+        st.plotly_chart(figures[f'{selected_column} - {title} Movement (%)'], use_container_width=True)
+
+    # Timeline - every period in one figure, so scrubbing through them does not rerun the app
+    if charts_dict.get('timeline') is not None:
+        st.markdown("## Timeline")
+        if st.toggle('Show all periods', key='account_stats_timeline'):
+            st.write("Drag the slider, or press Play, to move through the periods.")
+            st.plotly_chart(
+                cached_figure(chart=charts_dict['timeline'], data_version=data_version, cache_details=figure_cache_details),
+                use_container_width=True,
+            )
 
     return 0
\ No newline at end of file
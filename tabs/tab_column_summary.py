@@ -4,6 +4,7 @@ import numpy as np
 
 from utils import rounded_dollars_md
 from streamlit_utils import graph_selected_col
+from utils_dataframe_calcs import as_at_date
 
 
 def point_txt(
@@ -132,7 +133,7 @@ def tab_column_summary_content(
     # Graph current month balances
     st.markdown("___")
     st.markdown(f"# {selected_column} as at {selected_date.strftime('%d %B %Y')}")  
-    df_selected_date_to_graph = top_x_and_other_df[top_x_and_other_df[date_column] == selected_date]
+    df_selected_date_to_graph = as_at_date(top_x_and_other_df, date_column, selected_date)
     graph_selected_col(
         df=df_selected_date_to_graph,
         category_column=category_column,
@@ -0,0 +1,115 @@
+import streamlit as st
+import pandas as pd
+
+from utils import rounded_dollars_array, rounded_dollars_md, escape_dollar_signs
+from panel_cube import cube_two_date_comparison
+from chart_generator import chart_selected_col_bar
+from instrumentation import instrumented
+
+def comparison_date_selection(
+        periods,
+):
+    # Latest first, formatted as in data_select_filters.date_selection
+    dates_list = list(reversed(periods.to_pydatetime()))
+    dates_list_str = [date.strftime('%Y %B %d') for date in dates_list]
+
+    col1, col2 = st.columns(2)
+    with col1:
+        comparison_date_str = st.selectbox(
+            'Comparison date',
+            dates_list_str,
+            index=min(12, len(dates_list_str) - 1),
+            key='date_comparison_comparison_date',
+        )
+    with col2:
+        current_date_str = st.selectbox(
+            'Current date',
+            dates_list_str,
+            index=0,
+            key='date_comparison_current_date',
+        )
+
+    return (
+        dates_list[dates_list_str.index(current_date_str)],
+        dates_list[dates_list_str.index(comparison_date_str)],
+    )
+
+@instrumented
+def tab_date_comparison(
+        panel_cube,
+        selected_column,
+        selected_category,
+        aliases_dict,
+        color_discrete_map,
+        top_movements: int = 15,
+):
+    # Tab header
+    st.markdown(f"# {selected_column} - Date Comparison")
+    st.write("Compare any two reporting dates for all institutions:")
+
+    current_date, comparison_date = comparison_date_selection(panel_cube['periods'])
+    if current_date <= comparison_date:
+        st.write("Please select a comparison date before the current date.")
+        return 0
+
+    comparison_dict = cube_two_date_comparison(
+        cube=panel_cube,
+        selected_column=selected_column,
+        current_date=current_date,
+        comparison_date=comparison_date,
+    )
+    comparison_df = comparison_dict['df']
+    category_column = panel_cube['category_column']
+    dollar_movements_col = comparison_dict['dollar_movements_col_name']
+
+    # Key Points information
+    st.markdown("## Key Points:")
+    account_position = panel_cube['account_index'][selected_column]
+    market_totals = [
+        panel_cube['market_totals'][panel_cube['period_index'][pd.Timestamp(date)], account_position]
+        for date in [comparison_date, current_date]
+    ]
+    st.markdown(escape_dollar_signs(
+        f" - The total market's {selected_column} moved {rounded_dollars_md(market_totals[1] - market_totals[0])} "
+        f"from {rounded_dollars_md(market_totals[0])} at {comparison_date.strftime('%d %B %Y')} "
+        f"to {rounded_dollars_md(market_totals[1])} at {current_date.strftime('%d %B %Y')}."
+    ))
+
+    category_df = comparison_df[comparison_df[category_column] == selected_category]
+    if not category_df.empty:
+        alias = aliases_dict.get(selected_category, selected_category)
+        category_row = category_df.iloc[0]
+        st.markdown(escape_dollar_signs(
+            f" - {alias}'s {selected_column} moved {rounded_dollars_md(category_row[dollar_movements_col])} "
+            f"({category_row[comparison_dict['percentage_movements_col_name']]:.1%}), "
+            f"with its market share moving from {category_row['Comparison Market Share']:.2%} "
+            f"to {category_row['Current Market Share']:.2%}."
+        ))
+
+    # Largest movements
+    st.markdown(f"## Largest {top_movements} Movements")
+    movements_df = comparison_df.loc[
+        comparison_df[dollar_movements_col].abs().sort_values(ascending=False).index[:top_movements]
+    ].copy()
+    movements_df['chart_txt'] = rounded_dollars_array(movements_df[dollar_movements_col])
+    st.plotly_chart(
+        chart_selected_col_bar(
+            df = movements_df,
+            category_column = category_column,
+            reference_col = dollar_movements_col,
+            ordered_category_list = movements_df[category_column].tolist(),
+            x_gridcolor = 'Grey',
+            color_discrete_map = color_discrete_map,
+        ),
+        use_container_width=True,
+    )
+
+    # All institutions
+    st.markdown("## All Institutions")
+    st.dataframe(
+        comparison_df.sort_values(by='current', ascending=False),
+        hide_index=True,
+        use_container_width=True,
+    )
+
+    return 0
@@ -0,0 +1,46 @@
+import pickle
+
+import pandas as pd
+
+from chart_generator import LazyChart, build_figures
+from filter_cache import estimate_nbytes
+
+def lazy_chart():
+    df = pd.DataFrame({
+        'Institution Name': ['A', 'B', 'other'],
+        'Business Loans': [30.0, 20.0, 10.0],
+        'chart_txt': ['$ 30.0 ', '$ 20.0 ', '$ 10.0 '],
+    })
+    return LazyChart(
+        df=df,
+        category_column='Institution Name',
+        reference_col='Business Loans',
+        title='Business Loans',
+        ordered_category_list=['A', 'B', 'other'],
+        show_xaxis_labels=True,
+        x_tickformat=None,
+        x_gridcolor='Grey',
+        color_discrete_map={},
+    )
+
+def test_lazy_chart_does_not_keep_its_figure():
+    # Held in the size bounded pipeline cache, so its size must not grow once displayed
+    chart = lazy_chart()
+    nbytes = estimate_nbytes(chart)
+
+    figures = build_figures({'chart': chart}, pool_details={'max_workers': 1})
+
+    assert figures['chart'].data
+    assert estimate_nbytes(chart) == nbytes
+    assert list(chart.__dict__) == ['chart_kwargs']
+    assert list(pickle.loads(pickle.dumps(chart)).__dict__) == ['chart_kwargs']
+
+def test_build_figures_thread_pool_matches_serial():
+    charts = {'first': lazy_chart(), 'second': lazy_chart()}
+
+    serial_figures = build_figures(charts, pool_details={'max_workers': 1})
+    pool_figures = build_figures(charts, pool_details={'executor': 'thread', 'max_workers': 2})
+
+    assert list(pool_figures) == list(charts)
+    for name in charts:
+        assert pool_figures[name].to_json() == serial_figures[name].to_json()
@@ -0,0 +1,162 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import data_download
+from data_download import download_file, fetch_url_to_file, metadata_file_name
+
+CONTENT = b'MADIS back-series'
+ETAG = '"v1"'
+
+# No waiting between retries, and short timeouts for the stand-in server
+DOWNLOAD_DETAILS = {
+    'connect_timeout': 1,
+    'read_timeout': 0.5,
+    'max_retries': 2,
+    'backoff_seconds': 0,
+    'check_interval_seconds': 0,
+}
+
+class StandInServer:
+    """
+    A local stand-in for the APRA server. Each request takes the next of the
+    scripted responses - a status code, 'slow' (a response after the read timeout)
+    or 'blocked' (a response once released) - then 200 with CONTENT once they run out.
+    """
+    def __init__(self, responses=()):
+        self.responses = list(responses)
+        self.request_headers = []
+        self.requested = threading.Event()
+        self.release = threading.Event()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.request_headers.append(dict(self.headers))
+                server.requested.set()
+                response = server.responses.pop(0) if server.responses else 200
+                if response == 'slow':
+                    time.sleep(DOWNLOAD_DETAILS['read_timeout'] * 3)
+                    response = 200
+                elif response == 'blocked':
+                    server.release.wait(timeout=10)
+                    response = 200
+                if (response == 200) and (self.headers.get('If-None-Match') == ETAG):
+                    response = 304
+
+                self.send_response(response)
+                if response == 200:
+                    self.send_header('ETag', ETAG)
+                    self.send_header('Content-Length', str(len(CONTENT)))
+                    self.end_headers()
+                    self.wfile.write(CONTENT)
+                else:
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.http_server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.http_server.server_port}/madis.xlsx'
+        self.thread = threading.Thread(target=self.http_server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release.set()
+        self.http_server.shutdown()
+        self.http_server.server_close()
+
+@pytest.fixture
+def file_name(tmp_path):
+    return str(tmp_path / 'madis.xlsx')
+
+def test_not_modified_keeps_the_file(file_name):
+    with StandInServer() as server:
+        assert fetch_url_to_file(server.url, file_name, download_details=DOWNLOAD_DETAILS)
+        with open(metadata_file_name(file_name)) as f:
+            first_checked_at = json.load(f)['checked_at']
+
+        # The second request is conditional, and answered 304
+        assert not fetch_url_to_file(server.url, file_name, download_details=DOWNLOAD_DETAILS)
+
+    assert server.request_headers[1]['If-None-Match'] == ETAG
+    with open(file_name, 'rb') as f:
+        assert f.read() == CONTENT
+    with open(metadata_file_name(file_name)) as f:
+        metadata = json.load(f)
+    assert (metadata['url'], metadata['etag']) == (server.url, ETAG)
+    assert metadata['checked_at'] >= first_checked_at
+
+def test_server_errors_are_retried(file_name):
+    with StandInServer(responses=[503, 502]) as server:
+        assert fetch_url_to_file(server.url, file_name, download_details=DOWNLOAD_DETAILS)
+
+    assert len(server.request_headers) == 3
+    with open(file_name, 'rb') as f:
+        assert f.read() == CONTENT
+
+def test_server_errors_raise_after_the_retries(file_name):
+    with StandInServer(responses=[503, 503, 503]) as server:
+        with pytest.raises(requests.exceptions.HTTPError):
+            fetch_url_to_file(server.url, file_name, download_details={**DOWNLOAD_DETAILS, 'max_retries': 1})
+
+    assert len(server.request_headers) == 2
+    assert not os.path.exists(file_name)
+
+def test_timeouts_are_retried(file_name):
+    with StandInServer(responses=['slow']) as server:
+        assert fetch_url_to_file(server.url, file_name, download_details=DOWNLOAD_DETAILS)
+
+    assert len(server.request_headers) == 2
+
+def test_timeouts_raise_after_the_retries(file_name):
+    with StandInServer(responses=['slow']) as server:
+        with pytest.raises(requests.exceptions.Timeout):
+            fetch_url_to_file(server.url, file_name, download_details={**DOWNLOAD_DETAILS, 'max_retries': 0})
+
+    assert not os.path.exists(file_name)
+
+def test_concurrent_callers_share_one_download(file_name, monkeypatch):
+    # Count the callers waiting on the download in progress
+    waiting = []
+
+    class CountingFuture(data_download.Future):
+        def result(self, timeout=None):
+            waiting.append(threading.current_thread().name)
+            return super().result(timeout)
+
+    monkeypatch.setattr(data_download, 'Future', CountingFuture)
+
+    results = {}
+    def download(name):
+        results[name] = download_file(server.url, file_name, download_details=DOWNLOAD_DETAILS)
+
+    with StandInServer(responses=['blocked']) as server:
+        owner = threading.Thread(target=download, args=('owner',))
+        owner.start()
+        assert server.requested.wait(timeout=5)
+
+        waiters = [threading.Thread(target=download, args=(f'waiter {i}',), name=f'waiter {i}') for i in range(3)]
+        for thread in waiters:
+            thread.start()
+        deadline = time.time() + 5
+        while (len(waiting) < len(waiters)) and (time.time() < deadline):
+            time.sleep(0.01)
+
+        server.release.set()
+        for thread in [owner] + waiters:
+            thread.join(timeout=5)
+
+    assert sorted(waiting) == ['waiter 0', 'waiter 1', 'waiter 2']
+    assert len(server.request_headers) == 1
+    assert results == {name: True for name in ['owner', 'waiter 0', 'waiter 1', 'waiter 2']}
+    assert data_download._in_flight_downloads == {}
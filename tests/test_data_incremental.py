@@ -0,0 +1,51 @@
+import logging
+
+import pandas as pd
+import pytest
+
+from data_incremental import incremental_data_loader, read_persisted_dataset, market_totals
+from panel_cube import build_panel_cube
+from test_panel_cube import DATE_COLUMN, CATEGORY_COLUMN, panel_df, assert_cubes_equal
+
+def test_incremental_update_of_panel_cube(tmp_path, caplog):
+    pytest.importorskip('pyarrow')
+    config_dict = {'data_cache': {'cache_folder': str(tmp_path / 'cache'), 'key_columns': [CATEGORY_COLUMN]}}
+    file_name = tmp_path / 'madis.xlsx'
+
+    # First file - a full rebuild
+    first_df = panel_df()
+    file_name.write_bytes(b'first')
+    incremental_data_loader(
+        config_dict=config_dict,
+        file_name=file_name,
+        date_column=DATE_COLUMN,
+        category_column=CATEGORY_COLUMN,
+        process_fn=lambda min_date=None: first_df if min_date is None else first_df[first_df[DATE_COLUMN] >= min_date],
+    )
+
+    # Second file - March revised and April added
+    second_df = pd.concat([
+        first_df.assign(**{'Business Loans': first_df['Business Loans'].where(first_df[DATE_COLUMN] != '2023-03-31', 1.0)}),
+        first_df[first_df[DATE_COLUMN] == '2023-03-31'].assign(**{DATE_COLUMN: pd.Timestamp('2023-04-30')}),
+    ], ignore_index=True)
+    file_name.write_bytes(b'second')
+    caplog.set_level(logging.DEBUG)
+    persisted = incremental_data_loader(
+        config_dict=config_dict,
+        file_name=file_name,
+        date_column=DATE_COLUMN,
+        category_column=CATEGORY_COLUMN,
+        process_fn=lambda min_date=None: second_df if min_date is None else second_df[second_df[DATE_COLUMN] >= min_date],
+    )
+
+    assert 'Incremental update of 2 periods' in caplog.text
+    assert 'Updating the panel cube for 2 of 4 periods' in caplog.text
+
+    expected_cube = build_panel_cube(
+        df=second_df,
+        market_totals_df=market_totals(second_df, DATE_COLUMN, CATEGORY_COLUMN),
+        date_column=DATE_COLUMN,
+        category_column=CATEGORY_COLUMN,
+    )
+    assert_cubes_equal(persisted['panel_cube'], expected_cube)
+    assert_cubes_equal(read_persisted_dataset(config_dict)['panel_cube'], expected_cube)
@@ -0,0 +1,60 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from data_ingest import INGEST_ENGINES, engine_available
+
+DATE_COLUMN = 'Period'
+COL_TYPES_DICT = {
+    'date': ['Period'],
+    'str': ['ABN', 'Institution Name'],
+    'skip_cols': None,
+    'else_cols_as_type': 'float',
+}
+HEADER = ['Period', 'ABN', 'Institution Name', 'Business Loans', 'Intra-group deposits']
+
+@pytest.fixture(scope='module')
+def workbook_file(tmp_path_factory):
+    # As the APRA files - a title row before the header, latest period first, and
+    # empty cells for missing values
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.title = 'Table 1'
+    worksheet.append(['Monthly authorised deposit-taking institution statistics'])
+    worksheet.append(HEADER)
+    for period in [datetime.datetime(2023, 3, 31), datetime.datetime(2023, 2, 28), datetime.datetime(2023, 1, 31)]:
+        worksheet.append([period, 11111111111, 'Bank A', 1250.5, None])
+        worksheet.append([period, 22222222222, 'Bank B', 980.25, 12.0])
+        worksheet.append([period, None, 'Bank C', None, 3.5])
+    file_name = tmp_path_factory.mktemp('ingest') / 'madis.xlsx'
+    workbook.save(file_name)
+    return str(file_name)
+
+def read(engine, file_name, **kwargs):
+    return INGEST_ENGINES[engine](
+        file_name=file_name,
+        sheet_name='Table 1',
+        skiprows=1,
+        expected_columns_list=HEADER,
+        col_types_dict=COL_TYPES_DICT,
+        date_column=DATE_COLUMN,
+        **kwargs,
+    )
+
+@pytest.mark.parametrize('engine', ['openpyxl', 'calamine'])
+@pytest.mark.parametrize('min_date', [None, pd.Timestamp('2023-02-28')], ids=['all', 'min_date'])
+def test_streaming_matches_pandas_engines(workbook_file, engine, min_date):
+    if not engine_available(engine):
+        pytest.skip(f'The {engine} engine is not installed')
+
+    streaming_df = read('streaming', workbook_file, min_date=min_date, rows_newest_first=True)
+    pandas_df = read(engine, workbook_file, min_date=min_date)
+
+    # Rows skipped by min_date keep their position in the pandas index
+    pd.testing.assert_frame_equal(streaming_df.reset_index(drop=True), pandas_df.reset_index(drop=True))
+    assert streaming_df[DATE_COLUMN].dtype == np.dtype('datetime64[ns]')
+    assert streaming_df[DATE_COLUMN].min() == (min_date or pd.Timestamp('2023-01-31'))
+    assert streaming_df['ABN'].tolist().count('nan') == (2 if min_date else 3)
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from filter_cache import _filter_data_cache, cached_result, clear_filter_data_cache, estimate_nbytes
+from utils_dataframe_calcs import freeze_dataframe, up_to_date
+
+def shared_df():
+    periods = pd.date_range('2020-01-31', periods=12, freq='ME').repeat(100)
+    return freeze_dataframe(pd.DataFrame({
+        'Period': periods,
+        'Institution Name': [f'Bank {number % 100}' for number in range(len(periods))],
+        'Business Loans': np.arange(len(periods), dtype=float),
+    }))
+
+def cached_nbytes(compute_fn, shared_values):
+    clear_filter_data_cache()
+    key = 'test'
+    cached_result(key=key, compute_fn=compute_fn, shared_values=shared_values)
+    nbytes = _filter_data_cache[key][1]
+    clear_filter_data_cache()
+    return nbytes
+
+def test_views_of_shared_df_are_not_counted():
+    df = shared_df()
+
+    def compute_fn():
+        dated_df = up_to_date(df, 'Period', df['Period'].iloc[-1], dates_sorted=True)
+        return {'original_df': df, 'dated_df': dated_df}
+
+    # Sorted by date, so dated_df is a slice sharing the shared df's values - only its RangeIndex is counted
+    assert cached_nbytes(compute_fn, shared_values=[df]) < 1024
+
+def test_copies_and_new_columns_of_shared_df_are_counted():
+    df = shared_df()
+    copied_df = df.iloc[:600].copy()
+    new_column_df = pd.DataFrame({
+        'Business Loans': df['Business Loans'].to_numpy()[:600],
+        'Business Loans - MoM ($)': np.zeros(600),
+    }, copy=False)
+
+    assert cached_nbytes(lambda: copied_df, shared_values=[df]) == estimate_nbytes(copied_df)
+    assert cached_nbytes(lambda: new_column_df, shared_values=[df]) == 600 * 8 + new_column_df.index.nbytes
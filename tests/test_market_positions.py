@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_filtering import market_positions
+
+DATE_COLUMN = 'Period'
+CATEGORY_COLUMN = 'Institution Name'
+SELECTED_COLUMN = 'Business Loans'
+
+def per_period_market_positions(
+        df,
+        date_column,
+        category_column,
+        selected_column
+):
+    # The previous implementation - ranked one period at a time, with Rank left as float for NaN values
+    df_to_rank = df[[date_column, category_column, selected_column]]
+    market_position_df = pd.DataFrame()
+    for date in df_to_rank[date_column].unique():
+        rankings_df = df_to_rank[df_to_rank[date_column] == date][[date_column, category_column, selected_column]].sort_values(by=selected_column, ascending=False)
+        rankings_df['Rank'] = rankings_df[selected_column].rank(method='max', ascending=False)
+        rankings_df['Market Share'] = rankings_df[selected_column] / rankings_df[selected_column].sum()
+        if len(market_position_df) == 0:
+            market_position_df = rankings_df.copy()
+        else:
+            market_position_df = pd.concat([market_position_df, rankings_df], ignore_index=True)
+    return market_position_df
+
+def fixture_df():
+    # Ties, a period with missing values, a period of one category and dates out of order
+    return pd.DataFrame({
+        DATE_COLUMN: pd.to_datetime([
+            '2023-02-28', '2023-02-28', '2023-02-28', '2023-02-28',
+            '2023-01-31', '2023-01-31', '2023-01-31', '2023-01-31',
+            '2023-03-31', '2023-03-31', '2023-03-31', '2023-03-31',
+            '2023-04-30',
+        ]),
+        CATEGORY_COLUMN: ['A', 'B', 'C', 'D'] * 3 + ['A'],
+        SELECTED_COLUMN: [
+            10.0, 30.0, 20.0, 30.0,
+            5.0, 5.0, 5.0, 1.0,
+            np.nan, 7.0, np.nan, 3.0,
+            4.0,
+        ],
+    })
+
+def random_df(seed=0):
+    # Many categories and periods, with rounded values for ties and some missing values
+    rng = np.random.default_rng(seed)
+    periods = pd.date_range('2019-03-31', periods=24, freq='ME')
+    categories = [f'Institution {i}' for i in range(40)]
+    df = pd.DataFrame({
+        DATE_COLUMN: np.repeat(periods, len(categories)),
+        CATEGORY_COLUMN: np.tile(categories, len(periods)),
+        SELECTED_COLUMN: rng.integers(0, 20, len(periods) * len(categories)).astype(float),
+    })
+    df.loc[rng.random(len(df)) < 0.1, SELECTED_COLUMN] = np.nan
+    return df.sample(frac=1, random_state=seed, ignore_index=True)
+
+def sorted_by_category(df):
+    return df.sort_values(by=[DATE_COLUMN, CATEGORY_COLUMN], ignore_index=True)
+
+@pytest.mark.parametrize('df', [fixture_df(), random_df()], ids=['fixture', 'random'])
+def test_market_positions_matches_per_period(df):
+    expected = per_period_market_positions(df, DATE_COLUMN, CATEGORY_COLUMN, SELECTED_COLUMN)
+    result = market_positions(df, DATE_COLUMN, CATEGORY_COLUMN, SELECTED_COLUMN)
+
+    # Same rows, ranks and shares - the order of tied values within a period is not defined
+    pd.testing.assert_frame_equal(sorted_by_category(result), sorted_by_category(expected))
+
+    # Ordered by date, then by descending value within each date
+    assert list(result[DATE_COLUMN].unique()) == list(df[DATE_COLUMN].unique())
+    for _, period_df in result.groupby(DATE_COLUMN, sort=False):
+        values = period_df[SELECTED_COLUMN].dropna()
+        assert values.is_monotonic_decreasing
+        assert period_df[SELECTED_COLUMN].iloc[len(values):].isna().all()
+
+def test_market_positions_missing_values():
+    result = market_positions(fixture_df(), DATE_COLUMN, CATEGORY_COLUMN, SELECTED_COLUMN)
+    march_df = result[result[DATE_COLUMN] == '2023-03-31'].set_index(CATEGORY_COLUMN)
+
+    assert march_df.loc[['B', 'D'], 'Rank'].tolist() == [1.0, 2.0]
+    assert march_df.loc[['A', 'C'], 'Rank'].isna().all()
+    assert march_df.loc[['B', 'D'], 'Market Share'].tolist() == [0.7, 0.3]
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+
+from data_incremental import market_totals
+from panel_cube import build_panel_cube, cube_timeline_positions, panel_cube_arrays, panel_cube_from_arrays
+
+DATE_COLUMN = 'Period'
+CATEGORY_COLUMN = 'Institution Name'
+
+def panel_df():
+    # 'Intra-group deposits' is missing for some institutions, as in the MADIS data.
+    # D does not report in February
+    return pd.DataFrame({
+        DATE_COLUMN: pd.to_datetime(['2023-01-31'] * 4 + ['2023-02-28'] * 3 + ['2023-03-31'] * 4),
+        CATEGORY_COLUMN: ['A', 'B', 'C', 'D', 'A', 'B', 'C', 'A', 'B', 'C', 'D'],
+        'Business Loans': [40.0, 30.0, 20.0, 10.0, 42.0, 28.0, 22.0, 45.0, 25.0, 20.0, 15.0],
+        'Intra-group deposits': [5.0, np.nan, 3.0, 1.0, np.nan, 4.0, 2.0, 6.0, 3.0, np.nan, np.nan],
+    })
+
+def panel_cube(df=None, **update_kwargs):
+    df = panel_df() if df is None else df
+    return build_panel_cube(
+        df=df,
+        market_totals_df=market_totals(df, DATE_COLUMN, CATEGORY_COLUMN),
+        date_column=DATE_COLUMN,
+        category_column=CATEGORY_COLUMN,
+        **update_kwargs,
+    )
+
+def assert_cubes_equal(cube, expected_cube):
+    assert set(cube) == set(expected_cube)
+    for key, expected in expected_cube.items():
+        if isinstance(expected, np.ndarray):
+            assert cube[key].dtype == expected.dtype, key
+            np.testing.assert_array_equal(cube[key], expected, err_msg=key)
+        elif isinstance(expected, pd.Index):
+            assert cube[key].equals(expected), key
+        else:
+            assert cube[key] == expected, key
+
+def shown_categories(positions_df):
+    return {
+        period.strftime('%Y-%m'): period_df[CATEGORY_COLUMN].tolist()
+        for period, period_df in positions_df.groupby(DATE_COLUMN)
+    }
+
+def test_timeline_positions_top_x():
+    positions_df = cube_timeline_positions(
+        cube=panel_cube(),
+        selected_column='Business Loans',
+        top_x_value=2,
+        selected_category='D',
+    )
+
+    assert shown_categories(positions_df) == {
+        '2023-01': ['A', 'B', 'D'],
+        '2023-02': ['A', 'B'],
+        '2023-03': ['A', 'B', 'D'],
+    }
+    assert positions_df['Rank'].tolist() == [1.0, 2.0, 4.0, 1.0, 2.0, 1.0, 2.0, 4.0]
+
+def test_timeline_positions_missing_values():
+    positions_df = cube_timeline_positions(
+        cube=panel_cube(),
+        selected_column='Intra-group deposits',
+        top_x_value=2,
+        selected_category='C',
+    )
+
+    # Only categories with a value are shown - not A in February, nor the selected C in March
+    assert shown_categories(positions_df) == {
+        '2023-01': ['A', 'C'],
+        '2023-02': ['B', 'C'],
+        '2023-03': ['A', 'B'],
+    }
+    assert positions_df['Rank'].notna().all()
+    assert positions_df['Intra-group deposits'].notna().all()
+    assert positions_df['Market Share'].tolist() == [5 / 9, 3 / 9, 4 / 6, 2 / 6, 6 / 9, 3 / 9]
+
+def test_panel_cube_update_matches_full_build():
+    # January revised, February removed and April added since the previous cube
+    df = panel_df()
+    previous_df = df.copy()
+    previous_df.loc[previous_df[DATE_COLUMN] == '2023-01-31', 'Business Loans'] *= 2
+    df = pd.concat([
+        df[df[DATE_COLUMN] != '2023-02-28'],
+        df[df[DATE_COLUMN] == '2023-03-31'].assign(**{DATE_COLUMN: pd.Timestamp('2023-04-30'), 'Business Loans': 50.0}),
+    ], ignore_index=True)
+    affected_periods = pd.to_datetime(['2023-01-31', '2023-02-28', '2023-04-30']).tolist()
+
+    # Saved and loaded, as the persisted dataset's cube is
+    previous_cube = panel_cube_from_arrays(panel_cube_arrays(panel_cube(previous_df)))
+    updated_cube = panel_cube(df, previous_cube=previous_cube, affected_periods=affected_periods)
+
+    assert_cubes_equal(updated_cube, panel_cube(df))
+    # March's movement is recalculated, as February was removed
+    march = updated_cube['period_index'][pd.Timestamp('2023-03-31')]
+    assert np.isnan(updated_cube['movement'][march]).all()
+    assert not updated_cube['rank'].flags.writeable
+
+def test_panel_cube_update_with_new_category_builds_in_full():
+    df = panel_df()
+    df = pd.concat([df, df.iloc[[-1]].assign(**{CATEGORY_COLUMN: 'E'})], ignore_index=True)
+    previous_cube = panel_cube()
+
+    updated_cube = panel_cube(df, previous_cube=previous_cube, affected_periods=[pd.Timestamp('2023-03-31')])
+
+    assert_cubes_equal(updated_cube, panel_cube(df))
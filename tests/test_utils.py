@@ -0,0 +1,30 @@
+import os
+import stat
+
+import pytest
+
+from utils import atomic_write, current_umask
+
+@pytest.mark.skipif(os.name != 'posix', reason='POSIX file permissions')
+def test_atomic_write_uses_umask_permissions(tmp_path):
+    file_name = tmp_path / 'folder' / 'data.json'
+
+    atomic_write(file_name=file_name, write_fn=lambda f: f.write('{}'), mode='w', encoding='utf-8')
+
+    assert file_name.read_text(encoding='utf-8') == '{}'
+    assert stat.S_IMODE(os.stat(file_name).st_mode) == 0o666 & ~current_umask()
+    assert os.listdir(file_name.parent) == ['data.json']
+
+def test_atomic_write_keeps_old_file_on_error(tmp_path):
+    file_name = tmp_path / 'data.bin'
+    file_name.write_bytes(b'old')
+
+    def failing_write(f):
+        f.write(b'partial')
+        raise ValueError('write failed')
+
+    with pytest.raises(ValueError):
+        atomic_write(file_name=file_name, write_fn=failing_write)
+
+    assert file_name.read_bytes() == b'old'
+    assert os.listdir(tmp_path) == ['data.bin']
@@ -0,0 +1,40 @@
+import logging
+
+import pytest
+import yaml
+
+import utils_logging
+from utils_logging import HOT_PATH, setup_logging, close_log_handlers
+
+@pytest.mark.parametrize('async_handlers', [True, False], ids=['async', 'sync'])
+def test_hot_path_records_sampled_once_per_handler(tmp_path, monkeypatch, async_handlers):
+    # Logs folder within tmp_path, and a detailed file handler writing there
+    monkeypatch.setattr(utils_logging, 'project_absolute_path', lambda: tmp_path)
+    log_file = tmp_path / 'detailed.log'
+    log_config_path = tmp_path / 'logging.yaml'
+    log_config_path.write_text(yaml.safe_dump({
+        'version': 1,
+        'disable_existing_loggers': False,
+        'handlers': {
+            'detailed_file_handler': {'class': 'logging.FileHandler', 'level': 'DEBUG', 'filename': str(log_file)},
+        },
+        'root': {'level': 'DEBUG', 'handlers': ['detailed_file_handler']},
+    }))
+
+    setup_logging(
+        log_config_path=str(log_config_path),
+        logging_details={'async_handlers': async_handlers, 'hot_path_sample_every': 10},
+    )
+    ring_buffer = utils_logging._logging_state['ring_buffer']
+    try:
+        logger = logging.getLogger('tests.hot_path')
+        for i in range(100):
+            logger.debug(f'hot path {i}', extra=HOT_PATH)
+        logger.debug('not hot path')
+    finally:
+        # Writes any queued records
+        close_log_handlers()
+
+    expected = [f'hot path {i}' for i in range(0, 100, 10)] + ['not hot path']
+    assert log_file.read_text().splitlines() == expected
+    assert [record.getMessage() for record in ring_buffer.records] == expected
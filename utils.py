@@ -3,11 +3,13 @@ from math import floor, log10
 from dateutil.relativedelta import relativedelta
 
 import os
+import tempfile
 from pathlib import Path
 import logging
 import logging.config
 import yaml
-from math import isnan
+from math import isfinite
+import numpy as np
 
 def project_absolute_path() -> Path:
     return Path(__file__).resolve().parents[0]
@@ -64,6 +66,57 @@ def assert_file_extension(
         logger.info(f"AssertionError: {e}")
         raise AssertionError(f"AssertionError: {e}")
 
+def details_with_defaults(
+        default_details,
+        details=None,
+):
+    # A config.yaml section, with the defaults for any settings it does not set
+    merged_details = dict(default_details)
+    merged_details.update(details or {})
+    return merged_details
+
+def current_umask():
+    # The process umask - only readable by setting it, so it is set straight back
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+# Read once at import, as setting the umask to read it is not thread safe
+_umask = current_umask()
+
+def atomic_write(
+        file_name,
+        write_fn,
+        mode: str = 'wb',
+        encoding: str = None,
+):
+    """
+    Write a file via a temporary file in the same folder and an atomic rename,
+    so readers only ever see the old or the complete new file.
+
+    The file gets the permissions of a newly created file (0666 less the umask),
+    rather than the owner only permissions of the temporary file, so processes
+    running as other users can read it.
+
+    Parameters:
+        file_name (str): The file to write.
+        write_fn (callable): Called with the open temporary file to write the content.
+        mode (str): File mode for the temporary file.
+        encoding (str): Encoding of a text mode file.
+    """
+    folder = os.path.dirname(os.path.abspath(file_name))
+    os.makedirs(folder, exist_ok=True)
+    tmp_file, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+    try:
+        with os.fdopen(tmp_file, mode, encoding=encoding) as f:
+            write_fn(f)
+        os.chmod(tmp_path, 0o666 & ~_umask)
+        os.replace(tmp_path, file_name)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
 def read_yaml(file_path: str):
     try:
         with open(file_path, 'r') as file:
@@ -74,61 +127,92 @@ def read_yaml(file_path: str):
     except YAMLError as e:
         print(f"Error parsing YAML in '{file_path}': {e}")
 
-def rounded_number(number):
-    if (number is None) or (isnan(number)):
-        formatted_amount = None
+def rounded_numbers(numbers):
+    """
+    The sign, rounded amount and scale of each number, e.g. 1234567 as ('', '1.23', 'M').
+
+    The scale is found with log10, then checked against repeated division by 1000,
+    so numbers close to a scale boundary are scaled as dividing would.
+
+    Parameters:
+        numbers (array-like): The numbers to round.
+
+    Returns:
+        tuple: Arrays of the signs, formatted amounts and scales, and a boolean
+        array that is False where the number is missing or infinite.
+    """
+    scales = np.array(['', 'K', 'M', 'Bn', 'Trn', 'Quadr', 'Quint', 'Sext', 'Sept', 'Oct', 'Non', 'Dec'])
+    numbers = np.asarray(numbers, dtype=float).ravel()
+    valid = np.isfinite(numbers)
+    absolute = np.where(valid, np.abs(numbers), 0.0)
+
+    # Scale from log10, dividing by 1000 per scale
+    with np.errstate(divide='ignore'):
+        scale_index = np.clip(np.floor(np.log10(absolute) / 3), 0, len(scales) - 1).astype(int)
+    numbers_rounded = absolute.copy()
+    previous_rounded = absolute.copy()
+    for division in range(int(scale_index.max(initial=0))):
+        dividing = scale_index > division
+        previous_rounded = np.where(dividing, numbers_rounded, previous_rounded)
+        numbers_rounded = np.where(dividing, numbers_rounded / 1000, numbers_rounded)
+
+    # Correct the scale where log10 rounded across a boundary
+    over = (scale_index > 0) & (previous_rounded < 1000)
+    numbers_rounded = np.where(over, previous_rounded, numbers_rounded)
+    scale_index = scale_index - over
+    under = (numbers_rounded >= 1000) & (scale_index < len(scales) - 1)
+    numbers_rounded = np.where(under, numbers_rounded / 1000, numbers_rounded)
+    scale_index = scale_index + under
+
+    # Format (keeping the sign of -0.0), then keep 3 or 4
+    # characters based on the integer part of the number
+    numbers_rounded = np.where(absolute == 0, numbers, numbers_rounded)
+    number_strings = np.char.mod('%.2f', numbers_rounded)
+    number_strings_len = np.char.str_len(number_strings)
+    formatted_amounts = np.where(number_strings_len == 6, number_strings.astype('U3'), number_strings.astype('U4'))
+    formatted_amounts = np.where(number_strings_len > 7, number_strings, formatted_amounts)
+
+    signs = np.where(valid & (numbers < 0), '-', '')
+
+    return signs, formatted_amounts, scales[scale_index], valid
+
+def rounded_dollars_array(
+        dollars,
+        markdown = False,
+):
+    """
+    Vectorized rounded_dollars (or rounded_dollars_md if markdown), e.g. for chart labels.
+    Missing values are formatted as ''.
+
+    Parameters:
+        dollars (array-like): The dollar amounts.
+        markdown (bool): Format for markdown, as rounded_dollars_md.
+
+    Returns:
+        numpy.ndarray: The formatted strings.
+    """
+    signs, formatted_amounts, scales, valid = rounded_numbers(dollars)
+    if markdown:
+        parts = [signs, '\\$&nbsp;', formatted_amounts, '&nbsp;', scales]
     else:
-        scales = ['', 'K', 'M', 'Bn', 'Trn', 'Quadr', 'Quint', 'Sext', 'Sept', 'Oct', 'Non', 'Dec']  # Suffixes for scaling
-        
-        # Determine the appropriate scale
-        scale_index = 0
-        number_rounded = number
-        while abs(number_rounded) >= 1000 and scale_index < len(scales) - 1:
-            number_rounded /= 1000
-            scale_index += 1
-        
-        # Check number is within accepted scale
-        if scale_index >= len(scales):
-            raise ValueError("Absolute value of amount is too big to handle")  # Raise ValueError if scale index exceeds available scales
-        
-        # Adjust check for negative numbers
-        sign = ''
-        if number_rounded < 0:
-            sign = '-'
-            number_rounded = -1 * number_rounded
-
-        # Format string
-        number_string = "{:.2f}".format(number_rounded)
-        number_string_len=len(number_string)
-
-        # Round to appropriate decimal places based on integer part of the number
-        if number_string_len == 4:
-            formatted_amount = f"{number_string}"
-        elif number_string_len == 5:
-            formatted_amount = f"{number_string[0:4]}"
-        elif number_string_len == 6:
-            formatted_amount = f"{number_string[0:3]}"
-        elif number_string_len == 7:
-            formatted_amount = f"{number_string[0:4]}"
-        else:
-            # raise ValueError("Something went wrong")
-            print('error')
-            print(number)
-            print(number_rounded)
-            print(number_string)
-            print(number_string_len)
-            print(scale_index)
+        parts = [signs, '$ ', formatted_amounts, ' ', scales]
+
+    formatted_dollars = parts[0]
+    for part in parts[1:]:
+        formatted_dollars = np.char.add(formatted_dollars, part)
+
+    return np.where(valid, formatted_dollars, '').astype(object)
 
-    logger.info(formatted_amount)
-    return sign, formatted_amount, scales[scale_index]
+def rounded_percentages_array(percentages):
+    # Vectorized f"{x * 100:.1f} %", e.g. for chart labels
+    percentages = np.asarray(percentages, dtype=float).ravel()
+    return np.char.add(np.char.mod('%.1f', percentages * 100), ' %').astype(object)
 
 def rounded_dollars(dollars):
-    sign, dollars, scale = rounded_number(number = dollars)
-    return f'{sign}$ {dollars} {scale}'
+    return rounded_dollars_array([dollars])[0]
 
 def rounded_dollars_md(dollars):
-    sign, dollars, scale = rounded_number(number = dollars)
-    return f'{sign}\\$&nbsp;{dollars}&nbsp;{scale}'
+    return rounded_dollars_array([dollars], markdown=True)[0]
 
 def escape_dollar_signs(text):
     # Escaping all dollar signs for Markdown and avoiding HTML entities
@@ -148,8 +232,9 @@ def percentage_to_string(percentage):
     if percentage == 0:
         return "0%"
     
-    # Calculate the magnitude as the number of digits before the decimal point
-    magnitude = floor(-log10(percentage))
+    # Calculate the magnitude as the number of digits before the decimal point (negative percentages as
+    # positive, and infinite or missing percentages shown with the minimum precision)
+    magnitude = floor(-log10(abs(percentage))) if isfinite(percentage) else 1
     
     # Adjust precision based on the magnitude
     # Ensure a minimum of 1 digit and a maximum of 5 digits after the decimal
@@ -208,6 +293,23 @@ def period_ago_prefix(months_ago):
         prefix_txt = f"{int(months_ago)} months"
     return prefix_txt
 
+def comparison_col_names(
+        selected_column,
+        prefix = '',
+):
+    # Created padded varsiion of the prefix value
+    if prefix == '':
+        prefix_padded = ' '
+    else:
+        prefix_padded = ' ' + prefix + ' '
+
+    return {
+        'dollar_movements_col_name': f"{selected_column} -{prefix_padded}Movement ($)",
+        'movements_direction_col_name': f"{selected_column} -{prefix_padded}Movement Direction",
+        'percentage_movements_col_name': f"{selected_column} -{prefix_padded}Movement (%)",
+        'percentage_of_market_movements_col_name': f"{selected_column} -{prefix_padded}Movement as Percentage of Market(%)",
+    }
+
 def position_s_movement(position_movement):
     if position_movement == 1:
         text = 'position'
@@ -1,6 +1,9 @@
 import pandas as pd
+import numpy as np
 import logging
 
+from utils_logging import HOT_PATH
+
 # Create a logger variable
 logger = logging.getLogger(__name__)
 
@@ -23,7 +26,7 @@ def new_calculated_column(
     Returns:
     - pd.DataFrame: The DataFrame with the new calculated column.
     """
-    logger.debug('\nRunning: new_calculated_column')
+    logger.debug('\nRunning: new_calculated_column', extra=HOT_PATH)
 
     if calculation == 'add':
         df[new_column_name] = df[new_column_name] + df[column]
@@ -52,7 +55,7 @@ def filter_dataframe_by_values(df, df_column_filter_dict):
     logger.debug('\nRunning: filter_dataframe_by_values')
 
     for column, filter_values in df_column_filter_dict.items():
-        logger.debug(f"Filtering by {column}: {filter_values}")
+        logger.debug(f"Filtering by {column}: {filter_values}", extra=HOT_PATH)
         df = df[df[column].isin(filter_values)]
 
     return df
@@ -198,3 +201,136 @@ def df_column_movements_multiple(
     
     return df
 
+def grouped_movements(
+        df,
+        group_column,
+        movement_columns,
+        periods: int = 1,
+        suffix: str = 'MoM',
+):
+    """
+    Add dollar, percentage and direction movement columns, calculated within each
+    group in a single pass.
+
+    Rows are compared with the row `periods` rows earlier in the same group, so
+    the rows must be sorted by date within each group. The first `periods` rows
+    of each group have NaN movements and a 'none' direction.
+
+    Parameters:
+    - df (pd.DataFrame): The input DataFrame, updated in place.
+    - group_column (str): The column identifying each group, e.g. 'ABN'.
+    - movement_columns (list): The columns to calculate movements for.
+    - periods (int): The number of rows to look back, e.g. 1 for MoM or 12 for YoY on monthly data.
+    - suffix (str): Used in the new column names.
+
+    Returns:
+    - pd.DataFrame: The DataFrame with '<column> - <suffix> ($)', '<column> - <suffix> (%)'
+      and '<column> - <suffix> Movement Direction' columns for each movement column.
+    """
+    logger.debug('\nRunning: grouped_movements')
+
+    previous_df = df.groupby(group_column, sort=False, dropna=False)[movement_columns].shift(periods)
+
+    for column in movement_columns:
+        dollar_col = f'{column} - {suffix} ($)'
+        df[dollar_col] = df[column] - previous_df[column]
+        df[f'{column} - {suffix} (%)'] = df[dollar_col] / previous_df[column]
+        df[f'{column} - {suffix} Movement Direction'] = np.where(
+            df[dollar_col] < 0, 'decrease', np.where(df[dollar_col] > 0, 'increase', 'none')
+        )
+
+    return df
+
+def date_slice_bounds(
+        df,
+        date_column,
+        selected_date,
+):
+    """
+    Get the first and last (exclusive) positions of the selected date's rows,
+    by binary search on a DataFrame sorted by date_column. The order is not
+    checked, as that would scan every row.
+
+    Returns:
+        tuple: The start and end positions.
+    """
+    dates = df[date_column]
+    selected_date = pd.Timestamp(selected_date)
+    return (
+        int(dates.searchsorted(selected_date, side='left')),
+        int(dates.searchsorted(selected_date, side='right')),
+    )
+
+def as_at_date(
+        df,
+        date_column,
+        selected_date,
+        dates_sorted = False,
+):
+    """
+    Rows for the selected date - a contiguous slice if dates_sorted, otherwise a boolean filter.
+
+    dates_sorted must only be set for DataFrames known to be sorted by date_column
+    (e.g. the shared df - see data_store.get_shared_data), as it is not checked.
+    The slice may share its values with df, so copy it before modifying it.
+    """
+    if not dates_sorted:
+        return df[df[date_column] == selected_date]
+
+    start, end = date_slice_bounds(df, date_column, selected_date)
+    return df.iloc[start:end]
+
+def up_to_date(
+        df,
+        date_column,
+        selected_date,
+        dates_sorted = False,
+):
+    """
+    Rows up to and including the selected date - a contiguous slice if dates_sorted,
+    otherwise a boolean filter.
+
+    dates_sorted must only be set for DataFrames known to be sorted by date_column,
+    as it is not checked. The slice may share its values with df, so copy it before modifying it.
+    """
+    if not dates_sorted:
+        return df[df[date_column] <= selected_date]
+
+    _, end = date_slice_bounds(df, date_column, selected_date)
+    return df.iloc[:end]
+
+def freeze_dataframe(df):
+    """
+    Make the values of a DataFrame read-only, so a DataFrame shared between
+    Streamlit sessions cannot be modified in place.
+
+    Parameters:
+    - df (pd.DataFrame): The DataFrame to freeze.
+
+    Returns:
+    - pd.DataFrame: A DataFrame of the same columns, sharing their values with df but
+      read-only (extension dtype columns are left as they are). Use it in place of df.
+      Derived DataFrames (filters, copies, merges etc.) are writeable as normal.
+
+    Only writes to the values are blocked (e.g. through loc, iloc or to_numpy). pandas
+    cannot make the DataFrame object itself immutable, so replacing a column
+    (df[col] = ...), adding or dropping columns and inplace=True methods still change
+    the shared DataFrame without an error - never call them on a frozen DataFrame.
+    df.values of mixed dtypes is a writeable copy, so writing to it changes nothing.
+    """
+    # Each column as its own read-only array, so pandas cannot write through to them
+    columns = {}
+    for position in range(df.shape[1]):
+        column = df.iloc[:, position]
+        if isinstance(column.dtype, np.dtype):
+            values = column.to_numpy()
+            values.flags.writeable = False
+            columns[position] = values
+        else:
+            columns[position] = column
+
+    frozen_df = pd.DataFrame(columns, index=df.index, copy=False)
+    frozen_df.columns = df.columns
+    frozen_df.attrs = df.attrs
+
+    return frozen_df
@@ -1,34 +1,160 @@
 # utils_logging.py
 import logging.config
+import logging.handlers
 import yaml
 import os
-import os
+import atexit
+import queue
 import shutil
+import threading
+from collections import deque
 from pathlib import Path
 
-from utils import project_absolute_path
+from utils import project_absolute_path, details_with_defaults
+
+# Default logging mode, overridden by logging in config.yaml
+DEFAULT_LOGGING_DETAILS = {
+    'async_handlers': True,
+    'write_files': True,
+    'ring_buffer_records': 10000,
+    'hot_path_sample_every': 1000,
+    'ring_buffer_format': '%(asctime)s - %(name)s - %(levelname)s - %(module)s - %(lineno)d - %(message)s',
+}
+
+# Pass as extra= for messages logged on every call of a hot path function, so they are sampled
+HOT_PATH = {'hot_path': True}
+
+# Handlers set up once per process, as streamlit reruns the script on every interaction
+_logging_state = {}
+_logging_state_lock = threading.Lock()
+
+class RingBufferHandler(logging.Handler):
+    """
+    Keeps the most recent records in memory, e.g. for the log downloads.
+    """
+    def __init__(self, capacity):
+        super().__init__()
+        self.records = deque(maxlen=capacity)
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def formatted_text(self, level=logging.DEBUG, formatter=None):
+        formatter = formatter or self.formatter or logging.Formatter()
+        self.acquire()
+        try:
+            records = list(self.records)
+        finally:
+            self.release()
+
+        return ''.join(formatter.format(record) + '\n' for record in records if record.levelno >= level)
+
+class HotPathSampler(logging.Filter):
+    """
+    Passes the first and then every sample_every-th record logged with HOT_PATH
+    from each line, and all other records.
+    """
+    def __init__(self, sample_every):
+        super().__init__()
+        self.sample_every = max(int(sample_every), 1)
+        self.counts = {}
+
+    def filter(self, record):
+        if not getattr(record, 'hot_path', False):
+            return True
+        location = (record.pathname, record.lineno)
+        count = self.counts.get(location, 0)
+        self.counts[location] = count + 1
+
+        return (count % self.sample_every) == 0
 
 def setup_logging(
         log_config_path='logging.yaml',
         default_level=logging.INFO,
+        logging_details=None,
 ):
-    """Setup logging configuration"""
-
-    # Set up logs folder
-    logs_folder = str(project_absolute_path()) + '/logs'
-    if os.path.exists(logs_folder):
-        shutil.rmtree(logs_folder)
-    Path(logs_folder).mkdir(parents=True, exist_ok=True)
-
-    # Config logger
-    if os.path.exists(log_config_path):
-        with open(log_config_path, 'rt') as f:
-            config = yaml.safe_load(f.read())
-        logging.config.dictConfig(config)
-    else:
-        logging.basicConfig(level=default_level)
+    """
+    Setup logging configuration, once per process.
+
+    With async_handlers, the handlers from log_config_path are run by a background
+    thread fed from a queue, so logging does not wait on disk I/O. Recent records
+    are also kept in memory - see log_records_text.
+
+    Parameters:
+        log_config_path (str): The logging.config dictConfig yaml.
+        default_level (int): Level if log_config_path does not exist.
+        logging_details (dict): Logging mode - see DEFAULT_LOGGING_DETAILS.
+    """
+    with _logging_state_lock:
+        if _logging_state:
+            return
+
+        details = details_with_defaults(DEFAULT_LOGGING_DETAILS, logging_details)
+
+        # Set up logs folder - cleared when the process starts
+        logs_folder = str(project_absolute_path()) + '/logs'
+        if os.path.exists(logs_folder):
+            shutil.rmtree(logs_folder)
+        Path(logs_folder).mkdir(parents=True, exist_ok=True)
+
+        # Config logger
+        if os.path.exists(log_config_path):
+            with open(log_config_path, 'rt') as f:
+                config = yaml.safe_load(f.read())
+            logging.config.dictConfig(config)
+        else:
+            logging.basicConfig(level=default_level)
+
+        root = logging.getLogger()
+        handlers = root.handlers[:]
+        if not details['write_files']:
+            for handler in [handler for handler in handlers if isinstance(handler, logging.FileHandler)]:
+                handler.close()
+                handlers.remove(handler)
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+
+        ring_buffer = RingBufferHandler(capacity=int(details['ring_buffer_records']))
+        ring_buffer.setFormatter(logging.Formatter(details['ring_buffer_format']))
+        handlers.append(ring_buffer)
+
+        if details['async_handlers']:
+            # Records are queued, and handled by the listener's thread - sampled once, before queueing
+            queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+            queue_handler.addFilter(HotPathSampler(sample_every=details['hot_path_sample_every']))
+            root.addHandler(queue_handler)
+            listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+            listener.start()
+            _logging_state['listener'] = listener
+        else:
+            # Each handler filters every record, so each has its own sampler
+            for handler in handlers:
+                handler.addFilter(HotPathSampler(sample_every=details['hot_path_sample_every']))
+                root.addHandler(handler)
+
+        _logging_state['handlers'] = handlers
+        _logging_state['ring_buffer'] = ring_buffer
+
+    atexit.register(close_log_handlers)
+
+def log_records_text(level=logging.DEBUG):
+    """
+    The recent log records at or above level, as text.
+    """
+    ring_buffer = _logging_state.get('ring_buffer')
+    if ring_buffer is None:
+        return ''
+
+    return ring_buffer.formatted_text(level=level)
 
 def close_log_handlers():
-    for handler in logging.root.handlers[:]:
-        handler.close()
-        logging.root.removeHandler(handler)
\ No newline at end of file
+    # Stop the listener (writing any queued records) and close all handlers
+    with _logging_state_lock:
+        listener = _logging_state.pop('listener', None)
+        if listener is not None:
+            listener.stop()
+        for handler in _logging_state.pop('handlers', []) + logging.root.handlers[:]:
+            handler.close()
+            if handler in logging.root.handlers:
+                logging.root.removeHandler(handler)
+        _logging_state.clear()